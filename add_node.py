@@ -10,11 +10,45 @@ Created by Charlie Murphy
 This file adds a node in a given graph to the correct district.
 '''
 
-from partition_functions_2 import (check_population, get_split_nodes, 
-    check_contiguous)
+from collections import OrderedDict
+from partition_functions_2 import (check_contiguous, check_population, 
+    get_split_nodes)
 import random
-
-from write_partition import write_to_shapefile, write_to_csv
+from search_state import find_cut_nodes, get_marks, undo_marks
+from split_templates import get_templates
+from tree_splitter import draw_split
+
+# Split Cache
+# The splits of counties and municipalities found by step_down when splits are
+# reused (see split_strategy), with the most recently used last. Each split is
+# kept under the node that was split, the nodes bordering it that were already
+# in the district when it was entered, the band of the population the district
+# needed from it and the goals of the districts after it. Splits are reused 
+# across backtracking within a plan. The cache is cleared by create_map at the
+# start of every plan, since a split taken from it skips the random draws of a
+# search, and a plan would otherwise depend on the plans made before it in the
+# same process.
+split_cache = OrderedDict()
+
+# Number of splits that are kept
+SPLIT_CACHE_SIZE = 2000
+
+# Split Strategy
+# How step_down splits a node when no earlier split or template fits it. With
+# "search" the lower level is searched with attempt_map. With "tree" random 
+# spanning trees of the lower level are cut first, and the lower level is only
+# searched if none of them give a valid split. If "reuse" is True, the splits
+# found are kept in split_cache and tried first the next time the same node is
+# split from the same entry. This is set by create_map.
+split_strategy = {"method" : "search", "reuse" : False}
+
+# Number of spanning trees drawn by the "tree" strategy for each split
+TREE_DRAWS = 10
+
+# Step Downs
+# The number of times step_down has been called. How a node is split depends on
+# random draws, so a search that stepped down may not fail the same way twice.
+step_downs = {"count" : 0}
 
 # add_node
 # Add a given node to the partition according to the current population of the
@@ -30,7 +64,7 @@ def add_node(partitions, node, district, population, goals, pop_col,
 
     # Remove the population of any districts fully contained in the node from
     # the node population used for the below calculations
-    node_population = partitions[level].graph.nodes[node][pop_col]
+    node_population = partitions[level].node_population[node]
     if node in single_dict:
         node_population -= single_dict[1]
 
@@ -95,8 +129,7 @@ def add_node(partitions, node, district, population, goals, pop_col,
 
         # Guaruntee that splitting the current node won't cause the unallocated
         # nodes at the current level to be discontiguous
-        test_partition = partitions[level].flip({node : district})
-        if not check_contiguous(test_partition):
+        if partitions[level].splits_unallocated(node):
             return (False, False, None, None, None, None, None, None, None, 
                 None, None, None)
 
@@ -110,13 +143,20 @@ def add_node(partitions, node, district, population, goals, pop_col,
             remaining_population, node, ideal_population, node_population,
             population, split_nodes, assignment_col, dof_dictionary, nodes)
 
+        if not validity:
+            return (False, False, None, None, None, None, None, None, None, 
+                None, None, None)
+
         # Get the list of nodes that have been split and thus need to be 
         # given additional consideration to ensure continuity
         split_nodes = get_split_nodes(partitions, level, split_nodes, node)
 
-        if not validity:
-            return (False, False, None, None, None, None, None, None, None, 
-                None, None, None)
+        # Record how far the split node is from the first node of the district
+        # it now belongs to
+        if nodes == {node}:
+            dof_dictionary[node] = 0
+        else:
+            dof_dictionary[node] = dof_effect
 
         # Update dof_dictionary and unused nodes list
         unused_nodes.remove(node)
@@ -127,7 +167,7 @@ def add_node(partitions, node, district, population, goals, pop_col,
             subgraph_population):
 
             population = subgraph_population
-            subgraph_popualtion = 0
+            subgraph_population = 0
 
             partitions = allocate_remaining_nodes(node, unused_nodes, 
                 partitions, district, level, level_conversions)
@@ -166,48 +206,31 @@ def add_node(partitions, node, district, population, goals, pop_col,
 # flip_node
 # Flip the node and all sub-nodes at lower levels
 def flip_node(partitions, node, district, level, level_conversions):
-    
-    # County Level
-    if level == 0:
-
-        # County
-        partitions[0] = partitions[0].flip({node : district})
-
-        # Municipalities within County
-        for muni_node in level_conversions[0][node]:
-            partitions[1] = partitions[1].flip({muni_node : district})
-
-        # Update updaters to avoid recursion issues
-        partitions[1]["cut_edges"]
-        partitions[1]["population"]
-
-        # VTDs within County
-        for vtd_node in level_conversions[1][node]:
-            partitions[2] = partitions[2].flip({vtd_node : district})
-            
-            # Update updaters to avoid recursion issues
-            partitions[2]["cut_edges"]
-            partitions[2]["population"]
-    
-    # Muni Level
-    if level == 1:
-
-        # Municipality
-        partitions[1] = partitions[1].flip({node : district})
-
-        # VTDs within County
-        for vtd_node in level_conversions[2][node]:
-            partitions[2] = partitions[2].flip({vtd_node : district})
-
-            # Update updaters to avoid recursion issues
-            partitions[2]["cut_edges"]
-            partitions[2]["population"]
-
-    # VTD Level
-    if level == 2:
-
-        # VTDs
-        partitions[2] = partitions[2].flip({node : district})
+    return flip_nodes(partitions, [node], district, level, level_conversions)
+
+# flip_nodes
+# Flip every node in the collection, all at the given level, to the district
+# along with all of their sub-nodes at lower levels. The nodes are moved 
+# together in a single flip at their own level. The flips at the lower levels
+# are deferred until those levels are next read, which for most nodes is never
+# if the nodes are removed again while searching, and are then made a whole 
+# county or municipality at a time.
+def flip_nodes(partitions, nodes, district, level, level_conversions):
+    partitions[level] = partitions[level].flip(dict.fromkeys(nodes, district))
+
+    for node in nodes:
+
+        # Municipalities and VTDs within County
+        if level == 0:
+            partitions[1].defer((0, node), level_conversions[0][node], 
+                district)
+            partitions[2].defer((0, node), level_conversions[1][node], 
+                district)
+
+        # VTDs within Municipality
+        if level == 1:
+            partitions[2].defer((1, node), level_conversions[2][node], 
+                district)
 
     return partitions
 
@@ -220,10 +243,10 @@ def step_down(partitions, county_col, muni_col, pop_col, population_deviation,
     current_population, split_nodes, assignment_col, dof_dictionary, nodes):
 
     old_district = district
+    step_downs["count"] += 1
 
     # Create the new goals for the program while at the lower levels
     goals = new_goals(goals, district, district_num, remaining_population)
-    goals_copy = goals.copy()
 
     # Determine which nodes at the lower level are within the current nodes and
     # only allow them
@@ -232,19 +255,59 @@ def step_down(partitions, county_col, muni_col, pop_col, population_deviation,
     else:
         allowed_nodes = level_conversions[2][node]
 
-    # Move to the lower level and find a starting node
+    # Move to the lower level, making the flips deferred to it
     level += 1
-    starting_node = get_first_node(partitions[level], allowed_nodes, district)
-
-    # Run the algorithm on the subset of the lower level determined by 
-    # allowed_nodes
-    import create_map
-    validity, completion, proposed_partitions, proposed_goals,  \
-        proposed_district, proposed_population =  \
-        create_map.attempt_map(partitions, county_col, muni_col, pop_col, 
-        starting_node, population_deviation, district_num, goals, dof_max, 
-        district, dict(), level, level_conversions, allowed_nodes, 
-        node_population, split_nodes, assignment_col)
+    partitions[level].materialize()
+
+    # Reuse a split of this node found from the same entry if splits are 
+    # reused and there is one, then try the split templates of the node and,
+    # with the "tree" strategy, random spanning trees of the node. Otherwise 
+    # find a starting node and run the algorithm on the subset of the lower 
+    # level determined by allowed_nodes
+    validity = False
+    key = None
+    if split_strategy["reuse"]:
+        key = (level, node, get_entry_boundary(partitions[level], 
+            allowed_nodes, district), 
+            int(remaining_population // max(population_deviation, 1)),
+            tuple(goals[district:]))
+        validity, completion, proposed_partitions, proposed_goals, \
+            proposed_district, proposed_population = find_split(partitions, 
+            key, level, district, remaining_population, population_deviation,
+            split_nodes, goals)
+
+    if not validity:
+        validity, completion, proposed_partitions, proposed_goals, \
+            proposed_district, proposed_population = find_template(
+            partitions, level, node, district, district_num, 
+            remaining_population, population_deviation, node_population, 
+            goals, level_conversions, allowed_nodes)
+
+    if not validity and split_strategy["method"] == "tree":
+        validity, completion, proposed_partitions, proposed_goals, \
+            proposed_district, proposed_population = find_tree_split(
+            partitions, level, node, district, district_num, 
+            remaining_population, population_deviation, node_population, 
+            goals, level_conversions, allowed_nodes)
+
+    if not validity:
+        starting_node = get_first_node(partitions[level], allowed_nodes, 
+            district)
+        marks = get_marks(partitions)
+        previous_split_nodes = [set(nodes) for nodes in split_nodes]
+
+        import create_map
+        validity, completion, proposed_partitions, proposed_goals,  \
+            proposed_district, proposed_population =  \
+            create_map.attempt_map(partitions, county_col, muni_col, pop_col, 
+            starting_node, population_deviation, district_num, goals, dof_max, 
+            district, dict(), level, level_conversions, allowed_nodes, 
+            node_population, split_nodes, assignment_col)
+
+        if validity and key is not None:
+            remember_split(key, proposed_partitions, marks, level, district, 
+                remaining_population, split_nodes, previous_split_nodes, 
+                completion, proposed_district, proposed_population)
 
     # If the attempt at the lower level is successful
     if validity:
@@ -274,13 +337,203 @@ def step_down(partitions, county_col, muni_col, pop_col, population_deviation,
 
         return True, partitions, district, population, nodes, dof_dictionary
 
-    # If it is not, throw an error. This needs additional updating.
+    # If it is not, the node cannot be split here and the search backs up
     else:
-        write_to_csv(partitions[2], "GEOID20", "assignment", "Testing", "TEST_ERROR")
-        print("ERROR: add_node line 222")
-        input()
         return False, None, None, None, None, None
 
+# get_entry_boundary
+# Return the nodes outside of allowed_nodes that border them and are already in
+# the given district
+def get_entry_boundary(partition, allowed_nodes, district):
+    boundary = set()
+    for node in allowed_nodes:
+        for neighbor in partition.neighbors[node]:
+            if (partition.assignment[neighbor] == district and 
+                neighbor not in allowed_nodes):
+                boundary.add(neighbor)
+    return frozenset(boundary)
+
+# remember_split
+# Record the flips made at the lower levels by a successful split, with each
+# district given relative to the district the split started in, along with what
+# the split returned. Nodes that were flipped but left unallocated are skipped.
+def remember_split(key, partitions, marks, level, district, 
+    remaining_population, split_nodes, previous_split_nodes, completion, 
+    proposed_district, proposed_population):
+    flips = []
+    for i in range(level, 3):
+        partitions[i].materialize()
+        nodes = set(entry[0] for entry in partitions[i].log[marks[i]:] 
+            if entry[0] is not None)
+        flips.append({node : partitions[i].assignment[node] - district 
+            for node in nodes if partitions[i].assignment[node] != 1})
+
+    # The population given to the starting district within the split
+    population = sum(partitions[2].node_population[node] 
+        for node, offset in flips[-1].items() if offset == 0)
+
+    # The nodes added to split_nodes by the split
+    added = [nodes - previous for nodes, previous in zip(split_nodes, 
+        previous_split_nodes)]
+
+    split_cache[key] = (flips, population, remaining_population, added, 
+        completion, proposed_district - district, proposed_population)
+    split_cache.move_to_end(key)
+    if len(split_cache) > SPLIT_CACHE_SIZE:
+        split_cache.popitem(last = False)
+
+# find_split
+# Apply a split of the node found earlier from the same entry and return the 
+# same values as attempt_map. The split is only used if it still gives the 
+# district the population it needs and leaves the unallocated nodes and every
+# district it touches contiguous. Otherwise its flips are undone and the split 
+# fails. A split that did not finish the district it started in is only used 
+# for the same remaining population, since the rest of the district is found
+# after it.
+def find_split(partitions, key, level, district, remaining_population, 
+    population_deviation, split_nodes, goals):
+    if key not in split_cache:
+        return False, False, None, None, None, None
+    split_cache.move_to_end(key)
+
+    flips, population, previous_remaining_population, added, completion, \
+        district_offset, proposed_population = split_cache[key]
+    if district_offset == 0:
+        if remaining_population != previous_remaining_population:
+            return False, False, None, None, None, None
+    elif not check_population(population, remaining_population, 
+        population_deviation):
+        return False, False, None, None, None, None
+
+    marks = get_marks(partitions)
+    for i in range(level, 3):
+        partitions[i].flip({node : district + offset 
+            for node, offset in flips[i - level].items()})
+
+    # Check the unallocated nodes and the districts that were changed
+    districts = set(district + offset for offset in flips[-1].values())
+    if not check_split(partitions, level, districts):
+        undo_marks(partitions, marks)
+        return False, False, None, None, None, None
+
+    for nodes, new_nodes in zip(split_nodes, added):
+        nodes.update(new_nodes)
+
+    return (True, completion, partitions, goals, district + district_offset,
+        proposed_population)
+
+# find_template
+# Split the node with one of its split templates and return the same values as
+# attempt_map. The piece of a template is given to the district and the rest of
+# the node to the next district, so a template is only used if the piece gives
+# the district the population it needs and the rest is less than the goal of 
+# the next district, in which case attempt_map would also give it the rest. 
+# Both parts are connected by construction, so a template fits when its piece
+# borders the district, or the previous district if the district is empty, just
+# as the starting node of attempt_map would. The whole node is allocated either
+# way, so the unallocated nodes are left as they are when attempt_map gives the
+# rest of the node to the next district. The fitting templates are tried in a
+# random order until one leaves both districts contiguous at the VTD level.
+def find_template(partitions, level, node, district, district_num, 
+    remaining_population, population_deviation, node_population, goals, 
+    level_conversions, allowed_nodes):
+    if district == district_num:
+        return False, False, None, None, None, None
+
+    bordering_nodes = get_split_border(partitions[level], district, 
+        allowed_nodes)
+    fitting_templates = [(population, piece) for population, piece in 
+        get_templates(level, node, remaining_population, population_deviation,
+        node_population, goals[district]) 
+        if any(lower_node in bordering_nodes for lower_node in piece)]
+    if fitting_templates == []:
+        return False, False, None, None, None, None
+
+    random.shuffle(fitting_templates)
+    for population, piece in fitting_templates:
+        result = apply_split(partitions, level, district, population, piece, 
+            node_population, goals, level_conversions, allowed_nodes)
+        if result[0]:
+            return result
+
+    return False, False, None, None, None, None
+
+# find_tree_split
+# Split the node by cutting a random spanning tree of the nodes within it at 
+# the lower level and return the same values as attempt_map. Up to TREE_DRAWS 
+# trees are drawn. The piece cut from a tree must meet the same conditions as
+# the piece of a split template, and a split that leaves either district 
+# discontiguous at the VTD level is undone before the next tree is drawn.
+def find_tree_split(partitions, level, node, district, district_num, 
+    remaining_population, population_deviation, node_population, goals, 
+    level_conversions, allowed_nodes):
+    if district == district_num:
+        return False, False, None, None, None, None
+
+    bordering_nodes = get_split_border(partitions[level], district, 
+        allowed_nodes)
+    for i in range(TREE_DRAWS):
+        split = draw_split(partitions[level], level, node, allowed_nodes, 
+            remaining_population, population_deviation, goals[district], 
+            bordering_nodes)
+        if split is not None:
+            population, piece = split
+            result = apply_split(partitions, level, district, population, 
+                piece, node_population, goals, level_conversions, 
+                allowed_nodes)
+            if result[0]:
+                return result
+
+    return False, False, None, None, None, None
+
+# get_split_border
+# Return the unallocated nodes bordering the district that a piece of a split
+# may start from. If none of allowed_nodes border the district, the nodes 
+# bordering the previous district are used, as get_first_node does.
+def get_split_border(partition, district, allowed_nodes):
+    bordering_nodes = partition.bordering_nodes(district)
+    if not any(lower_node in bordering_nodes for lower_node in allowed_nodes):
+        bordering_nodes = partition.bordering_nodes(district - 1)
+    return bordering_nodes
+
+# apply_split
+# Give the piece of a split to the district and the rest of the node to the 
+# next district, along with the VTDs within them, and return the same values as
+# attempt_map. The pieces are connected at their own level, but the VTDs of
+# either district may not be, so the split is undone and fails if it leaves 
+# either district or the unallocated nodes discontiguous.
+def apply_split(partitions, level, district, population, piece, 
+    node_population, goals, level_conversions, allowed_nodes):
+    marks = get_marks(partitions)
+    partitions = flip_nodes(partitions, piece, district, level, 
+        level_conversions)
+    partitions = flip_nodes(partitions, set(allowed_nodes) - set(piece), 
+        district + 1, level, level_conversions)
+
+    if not check_split(partitions, level, {district, district + 1}):
+        undo_marks(partitions, marks)
+        return False, False, None, None, None, None
+
+    return (True, True, partitions, goals, district + 1, 
+        node_population - population)
+
+# check_split
+# Return whether or not the unallocated nodes at the given level and the levels
+# below it and the given districts at the VTD level are contiguous after a node
+# has been split. The districts are recorded as contiguous so that later checks
+# of nodes next to the split can be local.
+def check_split(partitions, level, districts):
+    if not all(check_contiguous(partitions[i]) for i in range(level, 3)):
+        return False
+    partitions[2].materialize()
+    for district in districts:
+        if not find_cut_nodes(partitions[2].neighbors, 
+            partitions[2].parts[district])[0]:
+            return False
+    for district in districts:
+        partitions[2].remember_district_contiguous(district)
+    return True
+
 # new_goals
 # Create a new goals list when stepping down
 def new_goals(old_goals, district, district_num, remaining_population):
@@ -311,17 +564,12 @@ def get_first_node(partition, allowed_nodes, district):
 
     # Create set of all valid first nodes
     bordering_nodes = []
-   
-    # Loop through the cut edges
-    for edge in partition["cut_edges"]:
-
-        # If an edge exists between the current district and an unallocated 
-        # allowed nodes, add said node the set of valid first nodes
-        for i in range(2):
-            if (edge[i - 1] in allowed_nodes 
-                and partition.assignment[edge[i - 1]] == 1
-                and partition.assignment[edge[i]] == district):
-                bordering_nodes.append(edge[i - 1])
+
+    # Add each unallocated allowed node bordering the current district once for
+    # every edge it shares with the district
+    for node, count in partition.bordering_nodes(district).items():
+        if node in allowed_nodes:
+            bordering_nodes.extend([node] * count)
 
     # If no nodes in the current district have been allocated, choose an
     # allowed node that shares an edge with a node allocated to the previous
@@ -338,7 +586,5 @@ def get_first_node(partition, allowed_nodes, district):
 
 def allocate_remaining_nodes(node, unused_nodes, partitions, district, level,
     level_conversions):
-    for node in unused_nodes:
-        partitions = flip_node(partitions, node, district, level, 
-            level_conversions)
-    return partitions
\ No newline at end of file
+    return flip_nodes(partitions, unused_nodes, district, level, 
+        level_conversions)
\ No newline at end of file
@@ -12,96 +12,163 @@ applying the Cervas-Groffman Algorithm.
 '''
 
 from create_clusters import create_clusters
-from create_map import create_map
 from discontiguous_counties import (correct_PA, check_contiguity, 
     muni_over_county, check_donuts)
 import geopandas
 from gerrychain import Graph
-from make_partition import get_updaters, make_partition
+from graph_cache import get_graph_keys, get_graph_paths
+from graph_snapshot import read_snapshot_graphs, snapshot_matches
+import os
+import pandas
+from parallel_ensemble import generate_plans, generate_plans_parallel, race_plan
 import pickle
 from reusable_data_2 import (get_ideal_population, get_starting_node, 
     get_county_subgraphs)
+from search_state import get_unallocated_states
+from split_templates import load_templates
 import time
 
 from write_partition import write_to_csv, write_to_shapefile
 
-# Update the recursion limit
-# By default, Python has a recursion limit of around 1000. However, when 
-# flipping nodes at the VTD level it is easy to exceed this because updating
-# the cut edges and population are also achieved recursively
-import sys
-sys.setrecursionlimit(5000)
-
-# Input Values
-exec(open("input_template_2.py").read())
-
-# Generate graphs if necessary
-if new_graphs:
-    exec(open("pickle_graph_2.py").read())
-
-# Otherwise, Load graphs and flipped entitites
-else:
-    graph_list = pickle.load(open(graph_dump, "rb"))
-    county_graph = graph_list[0]
-    muni_graph = graph_list[1]
-    vtd_graph = graph_list[2]
-
-# Create initial partitions
-my_updaters = get_updaters(pop_col)
-county_partition = make_partition(county_graph, district_num, assignment_col, 
-    my_updaters.copy())
-muni_partition = make_partition(muni_graph, district_num, assignment_col,
-    my_updaters.copy())
-vtd_partition = make_partition(vtd_graph, district_num, assignment_col, 
-    my_updaters.copy())
-
-# Create relationships between levels
-muni_to_county = get_county_subgraphs(county_graph, muni_graph, county_col)
-vtd_to_county = get_county_subgraphs(county_graph, vtd_graph, county_col)
-vtd_to_muni = get_county_subgraphs(muni_graph, vtd_graph, muni_col)
-level_conversions = [muni_to_county, vtd_to_county, vtd_to_muni, muni_col]
-
-# Get Set of Counties
-counties = set(county_graph.nodes())
-
-# Ideal Population
-ideal_population = get_ideal_population(county_partition, district_num)
-
-print(ideal_population)
-
-# Population Deviation
-population_deviation = ideal_population * epsilon
-
-print(population_deviation)
-print()
-
-# Starting Node
-starting_node = get_starting_node(county_graph, county_col, starting_county)
-
-#create_clusters(county_partition, pop_col, starting_node, 
-#    population_deviation, district_num, ideal_population, dof_max, vtd_partition)
-
-#print("Done")
-#input()
-
-t0_all = t0 = time.time()
-for i in range(runs):
-
-    partition = create_map(county_partition, muni_partition, vtd_partition,
-        county_col, muni_col, pop_col, starting_node, population_deviation, 
-        district_num, ideal_population, dof_max, level_conversions, counties,
-        assignment_col) 
-
-    write_to_csv(partition, "GEOID20", "assignment", "Testing", "TEST48")
-
-    t1 = time.time()
-
-    #vtds_file = r'C:\Users\charl\Box\Internships\Gerry Chain 2\States\Pennsylvania\2021 Data Set 2 Philly Removed\PA_2020_vtds.shp'
-    #write_to_shapefile(partition, "assignment", vtds_file, "Testing", "TEST33")
-
-    print(t1 - t0)
+# The work is only done when this file is run directly. The workers used for 
+# parallel ensembles import this file on some platforms, and should not create
+# an ensemble of their own.
+if __name__ == "__main__":
+
+    # Input Values
+    exec(open("input_template_2.py").read())
+
+    # Find where the graphs are kept in the graph cache, if there is one. They
+    # only need to be generated if they are not there yet.
+    if graph_cache is not None:
+        graph_dump, graph_snapshot = get_graph_paths(graph_cache, 
+            get_graph_keys(graph_cache, county_file, muni_file, vtd_file, 
+            assignment_col, county_col, geoid_col, muni_col, name_col, 
+            pop_col, geom_col))
+        new_graphs = not os.path.isdir(graph_snapshot)
+
+    # Generate graphs if necessary
+    use_snapshot = False
+    if new_graphs:
+        exec(open("pickle_graph_2.py").read())
+
+    # Otherwise, Load graphs and flipped entitites from the snapshot if it was
+    # written for the current graph file, or else from the graph file
+    else:
+        use_snapshot = snapshot_matches(graph_snapshot, graph_dump)
+        if use_snapshot:
+            graph_list, level_conversions = read_snapshot_graphs(
+                graph_snapshot, muni_col)
+        else:
+            graph_list = pickle.load(open(graph_dump, "rb"))
+        county_graph = graph_list[0]
+        muni_graph = graph_list[1]
+        vtd_graph = graph_list[2]
+
+    # Create the initial search states, with every node unallocated. The 
+    # graphs read from a snapshot stay views over its arrays.
+    county_partition, muni_partition, vtd_partition = get_unallocated_states(
+        [county_graph, muni_graph, vtd_graph], pop_col)
+
+    # Create relationships between levels, unless they were read from the 
+    # snapshot
+    if not use_snapshot:
+        muni_to_county = get_county_subgraphs(county_graph, muni_graph, 
+            county_col)
+        vtd_to_county = get_county_subgraphs(county_graph, vtd_graph, 
+            county_col)
+        vtd_to_muni = get_county_subgraphs(muni_graph, vtd_graph, muni_col)
+        level_conversions = [muni_to_county, vtd_to_county, vtd_to_muni, 
+            muni_col]
+
+    # Get Set of Counties
+    counties = set(county_graph.nodes())
+
+    # Load the split templates, if they have been made
+    load_templates(template_file, graph_dump)
+
+    # Ideal Population
+    ideal_population = get_ideal_population(county_partition, district_num)
+
+    print(ideal_population)
+
+    # Population Deviation
+    population_deviation = ideal_population * epsilon
+
+    print(population_deviation)
     print()
 
-t1_all = time.time()
-print("Total Time: ", t1_all - t0_all)
-print("Average Time: ", (t1_all - t0_all) / runs)
\ No newline at end of file
+    # Starting Node
+    starting_node = get_starting_node(county_graph, county_col, starting_county)
+
+    #create_clusters(county_partition, pop_col, starting_node, 
+    #    population_deviation, district_num, ideal_population, dof_max, 
+    #    vtd_partition)
+
+    #print("Done")
+    #input()
+
+    # Race seeds for a single plan if asked to, writing the plan along with the
+    # statistics of every seed
+    if race > 0:
+        t0 = time.time()
+        run, partition, stats = race_plan(vtd_graph, graph_snapshot, 
+            graph_dump, template_file, county_col, muni_col, pop_col, 
+            starting_node, population_deviation, district_num, 
+            ideal_population, dof_max, assignment_col, race, seed, workers, 
+            restart_budget, split_method, reuse_splits)
+
+        if partition is not None:
+            write_to_csv(partition, geoid_col, assignment_col, folder, 
+                filename + "_" + str(run))
+            if write_shapefile:
+                write_to_shapefile(partition, assignment_col, vtd_file, 
+                    folder, filename + "_" + str(run), graph_cache)
+        stats = pandas.DataFrame(stats, columns = ["run", "outcome", "time", 
+            "restarts"])
+        stats.to_csv('./Ensembles/' + folder + '/' + filename + '_race.csv', 
+            index = False)
+
+        print(stats)
+        print("Total Time: ", time.time() - t0)
+
+    # Otherwise create the plans, either one after another or with a pool of 
+    # workers. Each plan is written as soon as it is completed.
+    else:
+        t0_all = time.time()
+        if workers > 1:
+            plans = generate_plans_parallel(vtd_graph, graph_snapshot, 
+                graph_dump, template_file, county_col, muni_col, pop_col, 
+                starting_node, population_deviation, district_num, 
+                ideal_population, dof_max, assignment_col, runs, seed, workers,
+                restart_budget, split_method, reuse_splits)
+        else:
+            plans = generate_plans(county_partition, muni_partition, 
+                vtd_partition, county_col, muni_col, pop_col, starting_node, 
+                population_deviation, district_num, ideal_population, dof_max, 
+                level_conversions, counties, assignment_col, runs, seed, 
+                restart_budget, split_method, reuse_splits)
+
+        for run, partition, seconds, restarts in plans:
+
+            # A run that found no plan is skipped so that the rest of the 
+            # ensemble is still written
+            if partition is None:
+                print("Run", run, "failed")
+                print(seconds)
+                print()
+                continue
+
+            write_to_csv(partition, geoid_col, assignment_col, folder, 
+                filename + "_" + str(run))
+            if write_shapefile:
+                write_to_shapefile(partition, assignment_col, vtd_file, 
+                    folder, filename + "_" + str(run), graph_cache)
+
+            print(seconds)
+            print("Restarts: ", restarts)
+            print()
+
+        t1_all = time.time()
+        print("Total Time: ", t1_all - t0_all)
+        print("Average Time: ", (t1_all - t0_all) / runs)
\ No newline at end of file
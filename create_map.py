@@ -11,53 +11,124 @@ This file creates a single redistricting plan with n-1 county splits by
 applying the Cervas-Groffman Algorithm.
 '''
 
-from add_node import add_node, flip_node
-from copy import copy
-from gerrychain import GeographicPartition
+from add_node import (add_node, flip_node, split_cache, split_strategy, 
+    step_downs)
+from collections import OrderedDict
 from partition_functions_2 import (check_contiguous, check_population, safe_add, 
-    check_split_nodes, check_subgraph)
-from make_partition import get_updaters, make_partition
+    check_split_nodes, check_subgraph, check_remaining_population)
 from next_node import next_node
 import random
-
-from write_partition import write_to_csv
+from search_state import SearchState, get_search_states, get_marks, undo_marks
+
+# Search Budget
+# The number of nodes the current attempt at a map may try, including those 
+# tried at lower levels, before it is abandoned. The limit is None when there is
+# no budget. The number of restarts made by the last call to create_map is kept
+# here as well.
+search_budget = {"limit": None, "used": 0, "restarts": 0}
+
+# Failed States
+# The keys of the states whose every continuation has been searched without 
+# finding a valid map, with the most recently used last. Reaching one of these
+# states again by adding the same nodes in a different order is skipped. Only
+# states whose search never stepped down are kept, since splitting a node 
+# depends on random draws, and the table is cleared on every restart.
+failed_states = OrderedDict()
+
+# Number of failed states that are kept
+FAILED_STATES_SIZE = 100000
+
+# Subgraph States
+# The search state of the subgraph of every county and municipality that has 
+# been searched at a lower level, kept by graph and nodes. Starting a new search
+# of the same subgraph only has to undo the flips made by the last one.
+subgraph_states = dict()
 
 # create_map
 # Crate a single redistricting plan with n-1 county splits by applying the 
-# Cervas-Groffman Algorithm.
+# Cervas-Groffman Algorithm. If restart_budget is given, each attempt may only
+# try that many nodes times the next value of the Luby sequence 
+# (1, 1, 2, 1, 1, 2, 4, ...) before the search is restarted from scratch. The
+# random number generator is not reseeded, so each restart tries a new order.
+# split_method is the strategy used to split counties and municipalities, 
+# either "search" or "tree", and reuse_splits is whether or not splits found 
+# while searching are kept and tried again (see add_node.py).
 def create_map(county_partition, muni_partition, vtd_partition, county_col, 
     muni_col, pop_col, starting_node, population_deviation, district_num, 
-    ideal_population, dof_max, level_conversions, counties, assignment_col):
-
-    # Start with district 2 since district 1 represents unallocated nodes
-    district = 2
-
-    # Create partitions list
-    partitions = [county_partition, muni_partition, vtd_partition]
-
-    # Add single county nodes
-    """
-    start_partitions, district, single_dict = single_county_districts(
-        partitions, pop_col, district, ideal_population, population_deviation, 
-        level_conversions)
-    """
-    start_partitions = partitions
-    single_dict = dict()
-    split_nodes = [set(),set()]
-
-    # Create initial population goal list
-    goals = [ideal_population for i in range(district_num)]
-
-    validity, completition, partitions, goals, districts, \
-        remaining_population = attempt_map(start_partitions, county_col, 
-        muni_col, pop_col, starting_node, population_deviation, 
-        district_num, goals, dof_max, district, single_dict, 0, 
-        level_conversions, counties, 0, split_nodes, assignment_col)
+    ideal_population, dof_max, level_conversions, counties, assignment_col,
+    restart_budget = None, split_method = "search", reuse_splits = False):
+
+    split_strategy["method"] = split_method
+    split_strategy["reuse"] = reuse_splits
+    search_budget["restarts"] = 0
+    split_cache.clear()
+    while True:
+
+        # Set the budget of this attempt and forget the states that failed in
+        # the last one
+        failed_states.clear()
+        search_budget["used"] = 0
+        search_budget["limit"] = None
+        if restart_budget is not None:
+            search_budget["limit"] = restart_budget * get_luby(
+                search_budget["restarts"] + 1)
+
+        # Start with district 2 since district 1 represents unallocated nodes
+        district = 2
+
+        # Create the list of search states. These are changed in place as 
+        # nodes are added, so the partitions that were passed in are left as 
+        # they are.
+        partitions = get_search_states([county_partition, muni_partition, 
+            vtd_partition], pop_col)
+
+        # Add single county nodes
+        """
+        start_partitions, district, single_dict = single_county_districts(
+            partitions, pop_col, district, ideal_population, 
+            population_deviation, level_conversions)
+        """
+        start_partitions = partitions
+        single_dict = dict()
+        split_nodes = [set(),set()]
+
+        # Create initial population goal list
+        goals = [ideal_population for i in range(district_num)]
+
+        validity, completition, partitions, goals, districts, \
+            remaining_population = attempt_map(start_partitions, county_col, 
+            muni_col, pop_col, starting_node, population_deviation, 
+            district_num, goals, dof_max, district, single_dict, 0, 
+            level_conversions, counties, 0, split_nodes, assignment_col)
+
+        # Restart if the attempt ran out of budget
+        if not validity and budget_spent():
+            search_budget["restarts"] += 1
+            print("Restart", search_budget["restarts"])
+            continue
 
-    if validity:
-        return partitions[2]
-    else:
-        print("Fatal Error: Line 62")
+        if validity:
+            partitions[2].materialize()
+            return partitions[2]
+        else:
+            print("Fatal Error: Line 62")
+            return None
+
+# get_luby
+# Return the ith value (starting at 1) of the Luby sequence
+def get_luby(i):
+    while True:
+        k = i.bit_length()
+        if i == (1 << k) - 1:
+            return 1 << (k - 1)
+        i -= (1 << (k - 1)) - 1
+
+# budget_spent
+# Return whether or not the current attempt has tried as many nodes as its 
+# budget allows
+def budget_spent():
+    return (search_budget["limit"] is not None and 
+        search_budget["used"] >= search_budget["limit"])
 
 # attempt_map
 # Try to make a valid map if one exists.
@@ -70,10 +141,8 @@ def attempt_map(partitions, county_col, muni_col, pop_col, starting_node,
 
     subgraph_partition = None
     if level !=0 :
-        subgraph = partitions[level].graph.subgraph(allowed_nodes)
-        my_updaters = get_updaters(pop_col)
-        subgraph_partition = make_partition(subgraph, district_num, assignment_col,
-            my_updaters)
+        subgraph_partition = get_subgraph_state(partitions[level], 
+            allowed_nodes, pop_col)
 
     # Add starting county
     validity, completition, partitions, nodes, district, population, \
@@ -98,93 +167,212 @@ def attempt_map(partitions, county_col, muni_col, pop_col, starting_node,
 
     return validity, completition, partitions, goals, district, population
 
+# get_subgraph_state
+# Return a search state of the subgraph of the partition's graph made of 
+# allowed_nodes with every node unallocated. The state is built the first time
+# the subgraph is searched and reset afterwards.
+def get_subgraph_state(partition, allowed_nodes, pop_col):
+    key = (partition.graph, frozenset(allowed_nodes))
+    if key not in subgraph_states:
+        subgraph = partition.graph.subgraph(allowed_nodes)
+        subgraph_states[key] = SearchState(subgraph, 
+            dict.fromkeys(allowed_nodes, 1), pop_col)
+    else:
+        subgraph_states[key].undo(0)
+    return subgraph_states[key]
+
+# attempt_map_helper
+# Search for a valid map by adding bordering nodes one at a time, backing up
+# whenever the current map can no longer be completed. The search keeps its own
+# stack of frames rather than recursing, so the depth of the search is limited
+# only by memory. Candidates are tried in the same order as a recursive depth
+# first search would try them. Every frame shares the same search states, so
+# backing up undoes the flips made since the frame was created.
 def attempt_map_helper(partitions, county_col, muni_col, pop_col, 
     population_deviation, district_num, goals, dof_max, district, single_dict, 
     level, level_conversions, allowed_nodes, subgraph_population, split_nodes,
     assignment_col, nodes, dof_dictionary, subgraph_partition, unused_nodes,
     population, previous_node):
 
-    # Check whether or not the unallocated nodes are contiguous on the whole
-    # map
-    contiguity_check = check_contiguous(partitions[level])
-
-    # Check whether or not the unallocated nodes are contiguous in the subgraph
-    subgraph_check = check_subgraph(subgraph_partition, level)
-
-    # Check whether or not the unallocated nodes are contiguous at other levels,
-    # if applicable
-    split_check = check_split_nodes(partitions, level, split_nodes, 
-        previous_node, district)
-
-    # False Case: If any of the above checks fail, return False
-    if not contiguity_check or not subgraph_check or not split_check:
-        return False, False, None, None, None, None, None
-
-    # True Case: If a valid plan is found, return it
-    if district == district_num and check_population(population,
-        goals[district_num - 1], population_deviation):
-        return True, True, partitions, goals, district, population, subgraph_population
-
-    # Find the unallocated counties that border the current district
-    bordering_nodes = next_node(partitions[level], nodes, district, 
-        dof_dictionary, allowed_nodes)
-
-    # Start at the minimum number of nodes away from the starting node and
-    # move upward
-    for dof in range(dof_max + 1):
-
-        if dof not in bordering_nodes:
-
-            # If we have tried every possible node, return false
-            if dof == dof_max:
-                return False, False, partitions, goals, district, population, subgraph_population
+    stack = [new_frame(partitions, goals, district, population, 
+        subgraph_population, split_nodes, nodes, dof_dictionary, 
+        subgraph_partition, unused_nodes, previous_node, None)]
+    stack[-1]["key"] = get_state_key(stack[-1], level)
+
+    while stack:
+        frame = stack[-1]
+
+        # Give up once the budget of the attempt has been spent. Every search
+        # at a higher level also gives up, so the attempt fails as a whole.
+        if budget_spent():
+            return False, False, None, None, None, None, None
+
+        # The first time a frame is reached, check it and find its candidates
+        if frame["bordering_nodes"] is None:
+
+            # Check whether or not the unallocated nodes are contiguous on the 
+            # whole map, in the subgraph and at other levels, if applicable, 
+            # and whether or not they still hold enough population for the 
+            # remaining districts
+            if (not check_contiguous(frame["partitions"][level]) or
+                not check_subgraph(frame["subgraph_partition"], level) or
+                not check_split_nodes(frame["partitions"], level, 
+                    frame["split_nodes"], frame["previous_node"], 
+                    frame["district"], level_conversions, frame["marks"]) or
+                not check_remaining_population(frame["partitions"][level], 
+                    frame["goals"], frame["district"], frame["population"], 
+                    population_deviation, district_num)):
+                pop_frame(stack)
+                continue
+
+            # True Case: If a valid plan is found, return it
+            if frame["district"] == district_num and check_population(
+                frame["population"], frame["goals"][district_num - 1], 
+                population_deviation):
+                return (True, True, frame["partitions"], frame["goals"], 
+                    frame["district"], frame["population"], 
+                    frame["subgraph_population"])
+
+            # Find the unallocated counties that border the current district
+            frame["bordering_nodes"] = next_node(frame["partitions"][level], 
+                frame["nodes"], frame["district"], frame["dof_dictionary"], 
+                allowed_nodes)
+
+        # Find the next candidate. If we have tried every possible node, back up
+        # to the previous frame, recording that the state fails unless a node
+        # was split while searching it
+        node = next_candidate(frame, dof_max)
+        if node is None:
+            if frame["step_downs"] == step_downs["count"]:
+                remember_failed(frame["key"])
+            pop_frame(stack)
             continue
 
-        # Shuffle the bordering counties
-        max_length_keys = list(bordering_nodes[dof])
-        random.shuffle(max_length_keys)
-
-        # For each bordering county, try to add it to the plan
-        for node in max_length_keys:
-            
-            # Attempt to add the node
-            validity, completion, proposed_partitions, proposed_nodes, \
-                proposed_district, proposed_population, \
-                proposed_dof_dictionary, proposed_goals, \
-                proposed_split_nodes, proposed_unused_nodes, \
-                proposed_subgraph_partition, proposed_subgraph_population = add_node(partitions.copy(), 
-                node, district, population, goals, pop_col, 
-                dof_dictionary.copy(), dof, single_dict, 
-                population_deviation, nodes.copy(), district_num, level,
-                level_conversions, county_col, muni_col, dof_max, 
-                subgraph_population, allowed_nodes, split_nodes.copy(), 
-                unused_nodes.copy(), subgraph_partition, assignment_col)
-
-            # If this is a lower level (muni or VTD) and the rest of the
-            # superset has been filled in, then declare the subgraph complete
-            if completion:
-                return (True, True, proposed_partitions, proposed_goals, 
-                    proposed_district, proposed_population, proposed_subgraph_population)
-
-            # If the resulting map is valid, make the recursive call
-            if validity:
-
-                new_validity, completion, new_partitions, new_goals, \
-                    new_district, new_population, new_subgraph_population = attempt_map_helper(
-                    proposed_partitions, county_col, muni_col, pop_col, 
-                    population_deviation, district_num, proposed_goals, dof_max, 
-                    proposed_district, single_dict, level, level_conversions, 
-                    allowed_nodes, proposed_subgraph_population, proposed_split_nodes,
-                    assignment_col, proposed_nodes, proposed_dof_dictionary, 
-                    proposed_subgraph_partition, proposed_unused_nodes,
-                    proposed_population, node)
-
-                # If the recursive call is a success, return the plan.
-                # Otherwise, continue looping to the next option
-                if new_validity:
-                    return (True, completion, new_partitions, new_goals, 
-                        new_district, new_population, new_subgraph_population)
-        
+        # Mark the search states so that the node can be removed again
+        search_budget["used"] += 1
+        states = frame["partitions"] + [frame["subgraph_partition"]]
+        marks = get_marks(states)
+
+        # Attempt to add the node
+        validity, completion, proposed_partitions, proposed_nodes, \
+            proposed_district, proposed_population, \
+            proposed_dof_dictionary, proposed_goals, \
+            proposed_split_nodes, proposed_unused_nodes, \
+            proposed_subgraph_partition, proposed_subgraph_population = add_node(
+            frame["partitions"].copy(), node, frame["district"], 
+            frame["population"], frame["goals"], pop_col, 
+            frame["dof_dictionary"].copy(), frame["dof"], single_dict, 
+            population_deviation, frame["nodes"].copy(), district_num, level,
+            level_conversions, county_col, muni_col, dof_max, 
+            frame["subgraph_population"], allowed_nodes, 
+            frame["split_nodes"].copy(), frame["unused_nodes"].copy(), 
+            frame["subgraph_partition"], assignment_col)
+
+        # If this is a lower level (muni or VTD) and the rest of the
+        # superset has been filled in, then declare the subgraph complete
+        if completion:
+            return (True, True, proposed_partitions, proposed_goals, 
+                proposed_district, proposed_population, 
+                proposed_subgraph_population)
+
+        # If the resulting map is valid and has not already been searched, 
+        # continue the search from it. Otherwise, remove the node and continue
+        # looping to the next option
+        if validity:
+            proposed_frame = new_frame(proposed_partitions, proposed_goals, 
+                proposed_district, proposed_population, 
+                proposed_subgraph_population, proposed_split_nodes, 
+                proposed_nodes, proposed_dof_dictionary, 
+                proposed_subgraph_partition, proposed_unused_nodes, node, 
+                marks)
+            proposed_frame["key"] = get_state_key(proposed_frame, level)
+            if known_failed(proposed_frame["key"]):
+                undo_marks(states, marks)
+            else:
+                stack.append(proposed_frame)
+        else:
+            undo_marks(states, marks)
+
+    return False, False, None, None, None, None, None
+
+# new_frame
+# Create a search frame holding the state of the map after a node has been
+# added, along with the markers needed to remove the node again. The candidates
+# for the next node are found when the frame is first reached.
+def new_frame(partitions, goals, district, population, subgraph_population,
+    split_nodes, nodes, dof_dictionary, subgraph_partition, unused_nodes,
+    previous_node, marks):
+    return {"partitions": partitions, "goals": goals, "district": district, 
+        "population": population, "subgraph_population": subgraph_population,
+        "split_nodes": split_nodes, "nodes": nodes, 
+        "dof_dictionary": dof_dictionary, 
+        "subgraph_partition": subgraph_partition, 
+        "unused_nodes": unused_nodes, "previous_node": previous_node, 
+        "marks": marks, "bordering_nodes": None, "dof": -1, "candidates": [], 
+        "index": 0, "step_downs": step_downs["count"]}
+
+# pop_frame
+# Remove the last frame from the stack and undo the flips made when its node
+# was added
+def pop_frame(stack):
+    frame = stack.pop()
+    if frame["marks"] is not None:
+        undo_marks(frame["partitions"] + [frame["subgraph_partition"]], 
+            frame["marks"])
+
+# get_state_key
+# Return a key for the state of the map in the given frame. It is made of the
+# Zobrist hashes and deferred flips of the search states along with everything
+# else that decides which continuations are valid, including the nodes of the
+# current district and their distances in dof_dictionary, which next_node 
+# reads to find the candidates.
+def get_state_key(frame, level):
+    subgraph_hash = None
+    if frame["subgraph_partition"] is not None:
+        subgraph_hash = frame["subgraph_partition"].zobrist
+    return (level, frame["district"], frame["population"], 
+        frame["subgraph_population"], tuple(frame["goals"]), 
+        tuple((state.zobrist, state.pending_key()) 
+            for state in frame["partitions"]), subgraph_hash,
+        tuple(frozenset(nodes) for nodes in frame["split_nodes"]),
+        frozenset(frame["nodes"]), frozenset(frame["dof_dictionary"].items()))
+
+# known_failed
+# Return whether or not the state with the given key is known to fail
+def known_failed(key):
+    if key in failed_states:
+        failed_states.move_to_end(key)
+        return True
+    return False
+
+# remember_failed
+# Record that the state with the given key fails, dropping the least recently
+# used state if there are too many
+def remember_failed(key):
+    failed_states[key] = True
+    failed_states.move_to_end(key)
+    if len(failed_states) > FAILED_STATES_SIZE:
+        failed_states.popitem(last = False)
+
+# next_candidate
+# Return the next bordering node to try from the given frame, or None if every
+# bordering node has been tried. Starting at the minimum number of nodes away 
+# from the starting node and moving upward, the bordering nodes at each 
+# distance are shuffled only once the search reaches that distance.
+def next_candidate(frame, dof_max):
+    while frame["index"] >= len(frame["candidates"]):
+        frame["dof"] += 1
+        if frame["dof"] > dof_max:
+            return None
+        if frame["dof"] in frame["bordering_nodes"]:
+            frame["candidates"] = list(frame["bordering_nodes"][frame["dof"]])
+            random.shuffle(frame["candidates"])
+            frame["index"] = 0
+
+    node = frame["candidates"][frame["index"]]
+    frame["index"] += 1
+    return node
+
 # single_county_districts
 # Add as many districts as possible where the district is fully contained within
 # a county
@@ -11,10 +11,7 @@ This file adds a single edge so that all counties in PA are contiguous. The same
 approach can be used to correct counties in other states if necessary
 '''
 
-from gerrychain import GeographicPartition
-from networkx import number_connected_components, connected_components
-from partition_functions_2 import get_pieces
-from reusable_data_2 import get_subgraph
+from multiprocessing import Pool
 
 # find_node_by_geoid
 # Return the node in the graph with the given GEOID
@@ -35,31 +32,63 @@ def correct_PA(graph, geoid_col, assignment_col):
 
 # check_contigutity
 # Prints a warning if the given graph is discontiguous with respect to the given
-# data layer and list the discontiguous ids.
+# data layer and list the discontiguous ids. Returns a dictionary mapping every
+# discontiguous id in the data layer to the number of nodes in each of its 
+# pieces, largest first.
 def check_contiguity(graph, data_layer, data_col, name_col):
 
     # Get list of every possible item and its name in the data_layer
     data_list = list(data_layer[data_col])
     name_list = list(data_layer[name_col])
 
-    # Find the subgraphs of the each item in the graph and check whether or not 
-    # they are connected
-    connected_components = []
-    for item in data_list:
-        subgraph = graph.subgraph(get_subgraph(graph, data_col, item))
-        connected_components.append(number_connected_components(subgraph))
+    # Find the pieces of every item in the graph at once
+    pieces = find_discontiguous(graph, data_col)
+    report = {item : pieces[item] for item in data_list if item in pieces}
 
     # Print warning if necessary
-    if max(connected_components) != 1:
+    if report != dict():
         print("WARNING: A graph is discontiguous for a data layer")
 
         # Print a list of the discontiguous items
         print("The following IDs are discontiguous: ")
-        for i in range(len(connected_components)):
-            if connected_components[i] != 1:
+        for i in range(len(data_list)):
+            if data_list[i] in report:
                 print(name_list[i])
         print()
 
+    return report
+
+# find_discontiguous
+# Returns a dictionary mapping every value of col that is discontiguous in the
+# graph to the number of nodes in each of its pieces, largest first. The 
+# pieces are found by joining the ends of every edge between nodes with the 
+# same value in a single pass over the edges.
+def find_discontiguous(graph, col):
+    values = {node : graph.nodes[node][col] for node in graph.nodes()}
+    parents = {node : node for node in values}
+    for node, neighbor in graph.edges():
+        if values[node] == values[neighbor]:
+            parents[find_root(parents, node)] = find_root(parents, neighbor)
+
+    # Count the nodes in every piece of every value
+    sizes = dict()
+    for node, value in values.items():
+        root = find_root(parents, node)
+        pieces = sizes.setdefault(value, dict())
+        pieces[root] = pieces.get(root, 0) + 1
+
+    return {value : sorted(pieces.values(), reverse = True)
+        for value, pieces in sizes.items() if len(pieces) > 1}
+
+# find_root
+# Return the node representing the piece of the given node, shortening the 
+# path to it along the way
+def find_root(parents, node):
+    while parents[node] != node:
+        parents[node] = parents[parents[node]]
+        node = parents[node]
+    return node
+
 # muni_over_county
 # Prints a warning and the offending municipalities' names if there is any
 # municipality nodes that share the same ID. Typically this means that the 
@@ -90,69 +119,131 @@ def muni_over_county(graph, muni_col, name_col):
 # Returns a dictionary mapping every donut node to the set of donut_hole nodes
 # that are inside of it. A donut_hole is defined as any municipality in a county
 # that is separated from the majority of the other municipalities in the county
-# by a single municipality. A donut hole is any such municipality
-def check_donuts(graph, counties, county_subgraphs, assignment_col):
+# by a single municipality. A donut hole is any such municipality. The counties
+# are checked by a pool of worker processes if workers is more than 1.
+def check_donuts(graph, counties, county_subgraphs, assignment_col, 
+    workers = 1):
+
+    # Collect the nodes of every county with more than one node, in the order
+    # they are checked, along with their neighbors within the county
+    tasks = []
+    for county in counties:
+        current_graph = graph.subgraph(county_subgraphs[county])
+        if len(current_graph.nodes()) > 1:
+            tasks.append((list(current_graph.nodes()), 
+                {node : list(current_graph.neighbors(node)) 
+                for node in current_graph.nodes()}))
+
+    # Find the donuts of every county, keeping them in the order of the 
+    # counties
+    if workers > 1:
+        with Pool(workers) as pool:
+            results = pool.map(find_county_donuts, tasks)
+    else:
+        results = map(find_county_donuts, tasks)
 
-    # Create empty dictionary
     donuts = dict()
+    for county_donuts in results:
+        donuts.update(county_donuts)
+    return donuts
 
-    # Loop through every county
-    for county in counties:
+# find_county_donuts
+# Return the donuts of a single county, given as its nodes and the neighbors 
+# of each node within the county. Every node that is not already a donut hole
+# is checked in turn. If removing it splits the rest of the county, every piece
+# smaller than the largest is made up of donut holes of that node. The pieces
+# left by removing each node are all found by a single search.
+def find_county_donuts(task):
+    nodes, neighbors = task
+    visited, index, ends, components, pieces, joined = find_pieces(neighbors,
+        nodes)
+
+    spans = set(components.values())
+
+    donuts = dict()
+    county_donuts = set()
+    for node in nodes:
+        if node in county_donuts:
+            continue
+
+        # The rest of the county is split into the subtrees cut off below the
+        # node, the rest of the component of the node unless it is the root, 
+        # and every other component. Each piece is a list of ranges of the
+        # visited nodes.
+        start, end = components[node]
+        node_pieces = [[span] for span in pieces[node]]
+        if index[node] != start:
+            node_pieces.append([(start, index[node]), (ends[node], end)] + 
+                joined[node])
+        node_pieces.extend([span] for span in spans
+            if span != (start, end))
+        if len(node_pieces) < 2:
+            continue
+
+        # Every piece smaller than the largest is made up of donut holes
+        sizes = [sum(last - first for first, last in piece) 
+            for piece in node_pieces]
+        donut_holes = set()
+        donuts[node] = donut_holes
+        for piece, size in zip(node_pieces, sizes):
+            if size < max(sizes):
+                for first, last in piece:
+                    donut_holes.update(visited[first:last])
+        county_donuts.update(donut_holes)
 
-        # Create a subgraph of each county that has the capacity to handle 2 
-        # districts
-        current_graph = graph.subgraph(county_subgraphs[county])
-        if len(current_graph.nodes()) > 1:
-            for node in current_graph.nodes():
-                current_graph.nodes()[node][assignment_col] = 2
-                break
-
-            # Create a partition of the subgraph
-            current_partition = GeographicPartition(current_graph, 
-                assignment = assignment_col)
-
-            # Create a set of all donut holes within the county
-            county_donuts = set()
-
-            # Flip every node to district 1 to start
-            for node in current_partition.graph.nodes():
-                current_partition = current_partition.flip({node : 1})
-            
-            # Loop through every node
-            for node in current_partition.graph.nodes():
-
-                # If the node is not a donut hole, move it to district 2
-                if node not in county_donuts:
-                    current_partition = current_partition.flip({node : 2})
-
-                    # If this results in district 1 becoming discontiguous,
-                    # then the current note is a donut
-                    for part, subgraph in current_partition.subgraphs.items():
-                        if (part == 1 and 
-                            number_connected_components(subgraph) != 1):
-
-                            # We then search through all of the connected 
-                            # components of district 1 and for all but the 
-                            # largest component any nodes in the components
-                            # are considered donut holes of the current district
-                            # and added to dictionary accordingly
-                            maxlength = 0
-                            componentlist = []
-                            donut_holes = set()
-                            donuts[node] = donut_holes
-                            for component in connected_components(subgraph):
-                                componentlist.append(component)
-                                if len(component)>maxlength:
-                                    maxlength = len(component)
-                            for component in componentlist:
-                                if len(component) < maxlength:
-                                    for add_node in component:
-                                        donut_holes.add(add_node)
-                                        county_donuts.add(add_node)
-
-                    # Flip the node back to district 1 before the next cycle of
-                    # the loop
-                    current_partition = current_partition.flip({node : 1})
-        
     return donuts
-        
\ No newline at end of file
+
+# find_pieces
+# Search the nodes depth first, in the same way as find_cut_nodes, and return
+# the nodes in the order they are visited along with, for every node, its 
+# place in that order, the end of its subtree in the search tree, and the 
+# range of its component. The subtree of every node is a range of the visited
+# nodes. For every node, the subtrees of its children are split into those 
+# that are cut off from the rest of the component when the node is removed and
+# those that are not.
+def find_pieces(neighbors, nodes):
+    visited = []
+    index = dict()
+    low = dict()
+    ends = dict()
+    components = dict()
+    pieces = {node : [] for node in nodes}
+    joined = {node : [] for node in nodes}
+
+    for root in nodes:
+        if root in index:
+            continue
+        start = len(visited)
+        index[root] = low[root] = start
+        visited.append(root)
+
+        stack = [(root, None, iter(neighbors[root]))]
+        while stack:
+            node, parent, children = stack[-1]
+            for child in children:
+                if child == parent:
+                    continue
+                if child in index:
+                    low[node] = min(low[node], index[child])
+                else:
+                    index[child] = low[child] = len(visited)
+                    visited.append(child)
+                    stack.append((child, node, iter(neighbors[child])))
+                    break
+
+            # Once every child has been visited, pass the lowest place 
+            # reachable from the subtree of the node up to its parent
+            else:
+                stack.pop()
+                ends[node] = len(visited)
+                if parent is not None:
+                    low[parent] = min(low[parent], low[node])
+                    if low[node] >= index[parent]:
+                        pieces[parent].append((index[node], ends[node]))
+                    else:
+                        joined[parent].append((index[node], ends[node]))
+
+        for node in visited[start:]:
+            components[node] = (start, len(visited))
+
+    return visited, index, ends, components, pieces, joined
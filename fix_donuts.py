@@ -8,68 +8,92 @@ Created by Charlie Murphy
 23 December 2021
 
 This file merges any nodes (either municipalities or VTDs) that are 
-completely surrounded by another node into said node.
+completely surrounded by another node into said node. Every hole is mapped
+to its donut once, the merged municipalities are dissolved together, and the
+VTDs are relabelled in a single pass.
 '''
 
 from discontiguous_counties import check_donuts
-import geopandas
 from gerrychain import Graph
+import pandas
 from reusable_data_2 import get_county_subgraphs
-from tqdm import tqdm
 
 # fix_donuts
 # Create a GeoDataFrame for the municipalities without donuts and update the
-# municipality column of the VTD data to match the labelling.
-def fix_donuts(county_filename, muni_filename, vtd_filename, assignment_col,
-    county_col, geoid_col, muni_col, name_col, pop_col, geom_col):
+# municipality column of the VTD data to match the labelling. The data is
+# given as GeoDataFrames that have already been read, along with the county
+# graph built from county_data. Donuts are found by the given number of worker
+# processes.
+def fix_donuts(county_data, muni_data, vtd_data, county_graph, assignment_col,
+    county_col, geoid_col, muni_col, name_col, pop_col, geom_col, 
+    workers = 1):
 
     # Create list of columns
     columns = [county_col, geoid_col, muni_col, name_col, pop_col, geom_col]
 
-    # Read the data into GeoDataFrames
-    vtd_data = geopandas.read_file(vtd_filename)
-    muni_data = geopandas.read_file(muni_filename)
-    county_data = geopandas.read_file(county_filename)
-
     # Create a graph for the purpose of finding donuts
     muni_data[assignment_col] = 1
     muni_graph = Graph.from_geodataframe(muni_data)
-    county_graph = Graph.from_geodataframe(county_data)
 
     # Get Subgraphs
     subgraphs = get_county_subgraphs(county_graph, muni_graph, county_col)
 
     # Find Donuts
     donuts = check_donuts(muni_graph, list(county_graph.nodes()), subgraphs, 
-        assignment_col)
+        assignment_col, workers)
 
     # Create New GeoDataFrame
     muni_results = muni_data[columns]
 
-    # Create list of used holes
-    holes = set()
-
-    # Merge holes into donuts
-    for donut in tqdm(donuts):
+    # Find the donut every hole is merged into
+    targets = get_donut_targets(donuts)
+    if targets == dict():
+        return muni_results, vtd_data
+
+    # Merge the holes into their donuts, summing their populations and
+    # combining their names with the name of the donut first. Only the merged
+    # municipalities are dissolved, so the rest keep their geometry as it is.
+    merged = muni_results.index.map(lambda node: targets.get(node, node))
+    in_group = merged.isin(list(targets.values()))
+    groups = muni_results[in_group].assign(_donut = merged[in_group],
+        _hole = muni_results.index[in_group].isin(list(targets)))
+    groups = groups.sort_values("_hole", kind = "stable").drop(
+        columns = "_hole")
+    aggfunc = {col : "first" for col in columns if col != geom_col}
+    aggfunc[pop_col] = "sum"
+    aggfunc[name_col] = " / ".join
+    groups = groups.dissolve(by = "_donut", aggfunc = aggfunc)
+
+    muni_results = pandas.concat([muni_results[~in_group], 
+        groups[columns]]).sort_index()
+    muni_results.index.name = muni_data.index.name
+
+    # Relabel the VTDs of every hole with the municipality of its donut
+    relabel = {muni_data[muni_col][hole] : muni_data[muni_col][donut]
+        for hole, donut in targets.items()}
+    vtd_data[muni_col] = vtd_data[muni_col].map(
+        lambda muni: relabel.get(muni, muni))
+
+    return muni_results, vtd_data
+
+# get_donut_targets
+# Return a dictionary mapping every hole to the donut it is merged into. Each
+# hole goes to the first donut it is found in, and a hole that is itself a
+# donut takes its holes with it, so holes within holes are merged into the
+# outermost donut.
+def get_donut_targets(donuts):
+    parents = dict()
+    for donut in donuts:
         for hole in donuts[donut]:
-            if hole not in holes:
-                holes.add(hole)
-
-                # Merge geometry
-                muni_results[geom_col][donut] = muni_results[geom_col][donut].union(muni_results[geom_col][hole])
-
-                # Sum Population
-                muni_results[pop_col][donut] = muni_results[pop_col][donut] + muni_results[pop_col][hole]
-
-                # Combine Name
-                muni_results[name_col][donut] = muni_results[name_col][donut] + " / " + muni_results[name_col][hole]
-
-                # Remove old hole entry
-                muni_results = muni_results.drop(labels = hole, axis = 0)
-
-                # Update muni name in 
-                for i in range(len(vtd_data)):
-                    if vtd_data[muni_col][i] == muni_data[muni_col][hole]:
-                        vtd_data[muni_col][i] = muni_results[muni_col][donut]
-
-    return muni_results, vtd_data
\ No newline at end of file
+            if hole not in parents and hole != donut:
+                parents[hole] = donut
+
+    targets = dict()
+    for hole in parents:
+        target = parents[hole]
+        seen = {hole}
+        while target in parents and target not in seen:
+            seen.add(target)
+            target = parents[target]
+        targets[hole] = target
+    return targets
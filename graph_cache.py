@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+graph_cache.py
+
+Created by Charlie Murphy
+18 October 2026
+
+This file keeps the graphs built from the shapefiles in a cache folder. Each
+graph is stored under a key made from the content of the files it is built
+from and the settings used to build it, so a graph is only built again when
+one of those changes and graphs are shared by every input file that uses the
+same data. The hash of each file is remembered by its path, size and time of
+last change so that unchanged files are not read again to find it.
+'''
+
+import hashlib
+import os
+import pickle
+
+# Version of the way the graphs are built. Changing this makes every graph in
+# the cache out of date.
+CACHE_VERSION = 1
+
+# Files that together make up a shapefile
+SHAPEFILE_EXTENSIONS = [".shp", ".shx", ".dbf", ".prj", ".cpg"]
+
+# Name of the file in the cache folder remembering the hash of each file
+FILE_HASHES = "file_hashes.dump"
+
+# get_file_hash
+# Return a hash of the content of the given file. For a shapefile, the files
+# that go with it are included.
+def get_file_hash(cache_folder, filename):
+    base, extension = os.path.splitext(filename)
+    files = [filename]
+    if extension.lower() == ".shp":
+        files = [base + extension for extension in SHAPEFILE_EXTENSIONS
+            if os.path.isfile(base + extension)]
+
+    # Use the remembered hash if none of the files have changed
+    stamp = tuple((os.path.abspath(file), os.path.getsize(file),
+        os.path.getmtime(file)) for file in files)
+    file_hashes = read_file_hashes(cache_folder)
+    if stamp in file_hashes:
+        return file_hashes[stamp]
+
+    digest = hashlib.sha256()
+    for file in files:
+        digest.update(os.path.splitext(file)[1].lower().encode())
+        with open(file, "rb") as data:
+            for chunk in iter(lambda: data.read(1 << 20), b""):
+                digest.update(chunk)
+
+    file_hashes[stamp] = digest.hexdigest()
+    with open(os.path.join(cache_folder, FILE_HASHES), "wb") as file:
+        pickle.dump(file_hashes, file)
+    return file_hashes[stamp]
+
+# read_file_hashes
+# Return the remembered hashes of the files in the cache folder
+def read_file_hashes(cache_folder):
+    os.makedirs(cache_folder, exist_ok = True)
+    path = os.path.join(cache_folder, FILE_HASHES)
+    if not os.path.isfile(path):
+        return dict()
+    return pickle.load(open(path, "rb"))
+
+# get_key
+# Return a key made from the given values, which are file hashes and settings
+def get_key(*values):
+    digest = hashlib.sha256(repr((CACHE_VERSION,) + values).encode())
+    return digest.hexdigest()[:16]
+
+# get_graph_keys
+# Return the key of each graph in the cache, along with the key of the list of
+# graphs. The county graph only depends on the county file, while the 
+# municipality and VTD graphs depend on every file since donuts are found with 
+# the counties and the VTDs are relabelled to match. The VTD graph is also 
+# patched by correct_PA.
+def get_graph_keys(cache_folder, county_file, muni_file, vtd_file, 
+    assignment_col, county_col, geoid_col, muni_col, name_col, pop_col, 
+    geom_col):
+    county_hash = get_file_hash(cache_folder, county_file)
+    muni_hash = get_file_hash(cache_folder, muni_file)
+    vtd_hash = get_file_hash(cache_folder, vtd_file)
+    settings = (assignment_col, county_col, geoid_col, muni_col, name_col, 
+        pop_col, geom_col)
+
+    keys = {"county" : get_key(county_hash, settings),
+        "muni" : get_key(county_hash, muni_hash, settings),
+        "vtd" : get_key(county_hash, muni_hash, vtd_hash, settings, 
+            "correct_PA")}
+    keys["graphs"] = get_key(keys["county"], keys["muni"], keys["vtd"])
+    return keys
+
+# get_graph_paths
+# Return the paths of the graph file and snapshot in the cache for the given
+# keys
+def get_graph_paths(cache_folder, keys):
+    return (cache_path(cache_folder, "graphs", keys["graphs"]) + ".dump",
+        cache_path(cache_folder, "snapshot", keys["graphs"]))
+
+# cache_path
+# Return the path in the cache folder of the entry with the given name and key
+def cache_path(cache_folder, name, key):
+    return os.path.join(cache_folder, name + "_" + key)
+
+# load_graph
+# Return the graph with the given name and key from the cache folder, or None
+# if it is not there
+def load_graph(cache_folder, name, key):
+    path = cache_path(cache_folder, name, key) + ".dump"
+    if not os.path.isfile(path):
+        return None
+    return pickle.load(open(path, "rb"))
+
+# store_graph
+# Write the graph to the cache folder under the given name and key. The graph
+# is written to a temporary file first so that a graph that is only partly
+# written is never loaded.
+def store_graph(graph, cache_folder, name, key):
+    path = cache_path(cache_folder, name, key) + ".dump"
+    with open(path + ".tmp", "wb") as file:
+        pickle.dump(graph, file)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+graph_snapshot.py
+
+Created by Charlie Murphy
+18 October 2026
+
+This file writes the county, municipality, and VTD graphs to a compiled
+snapshot and reads them back. A snapshot is a folder of .npy files. Each graph
+is stored as CSR adjacency (int32 indptr/indices, with the neighbors of every
+node kept in their cyclic order when it is known) along with typed columns for
+the attributes the algorithm uses. The membership of every VTD and municipality
+in the levels above it is stored both as parent arrays and as members grouped
+by parent, which give the level conversions directly. Because every array is a
+plain .npy file, the snapshot can be memory-mapped and shared by many
+processes instead of unpickling the full graphs and their geometry. The graphs
+read from a snapshot are views over the arrays, and the neighbors and 
+attributes of a node are only read from them when the search asks for them.
+The size and time of last change of the graph file are stored with the 
+snapshot, so a snapshot that was written for an older graph file is not used.
+'''
+
+from gerrychain import Graph
+import numpy
+import os
+import pandas
+
+# Names of the levels, in the same order as the list of graphs
+LEVELS = ["county", "muni", "vtd"]
+
+# The inner level, outer level and shared column of each level conversion, in 
+# the same order as level_conversions
+CONVERSIONS = [("muni", "county", "county"), ("vtd", "county", "county"), 
+    ("vtd", "muni", "muni")]
+
+# write_snapshot
+# Write the list of graphs [county, muni, vtd] to the snapshot folder. Only the
+# given columns are kept. The parent arrays map each node to the index of the
+# node in the graph above it with the same value in the county or muni column.
+# If the graph file the graphs were written to is given, its stamp is stored so
+# that the snapshot can be checked against it.
+def write_snapshot(graph_list, snapshot_folder, columns, county_col, muni_col,
+    graph_dump = None):
+    os.makedirs(snapshot_folder, exist_ok = True)
+
+    arrays = dict()
+    if graph_dump is not None:
+        arrays["source_stamp"] = get_file_stamp(graph_dump)
+    for level, graph in zip(LEVELS, graph_list):
+        arrays.update(compile_graph(graph, level, columns))
+
+    # Record the level above each node, along with the nodes within each node
+    # of the level above grouped into a contiguous array
+    for inner, outer, col in CONVERSIONS:
+        col = {"county" : county_col, "muni" : muni_col}[col]
+        name = inner + "_" + outer
+        arrays[name] = get_parents(arrays[inner + "_column_" + col], 
+            arrays[outer + "_column_" + col])
+        arrays[name + "_members"], arrays[name + "_indptr"] = get_members(
+            arrays[name], len(arrays[outer + "_nodes"]))
+
+    for name, array in arrays.items():
+        numpy.save(os.path.join(snapshot_folder, name + ".npy"), array)
+
+# compile_graph
+# Return a dictionary of the arrays describing a single graph
+def compile_graph(graph, level, columns):
+    nodes = sorted(graph.nodes())
+    index = {node : i for i, node in enumerate(nodes)}
+
+    # Use the cyclic order of the neighbors when every node has one
+    ordered = all("neighbor_order" in graph.nodes[node] for node in nodes)
+
+    # Create the CSR adjacency
+    indptr = numpy.zeros(len(nodes) + 1, dtype = numpy.int32)
+    indices = []
+    for i, node in enumerate(nodes):
+        if ordered:
+            neighbors = graph.nodes[node]["neighbor_order"]
+        else:
+            neighbors = graph.neighbors(node)
+        indices.extend(index[neighbor] for neighbor in neighbors)
+        indptr[i + 1] = len(indices)
+
+    arrays = {level + "_nodes" : numpy.array(nodes, dtype = numpy.int64),
+        level + "_indptr" : indptr,
+        level + "_indices" : numpy.array(indices, dtype = numpy.int32),
+        level + "_ordered" : numpy.array(ordered)}
+
+    # Add the columns each node has. Numbers keep their type and everything
+    # else is stored as a fixed width string.
+    for col in columns:
+        if not all(col in graph.nodes[node] for node in nodes):
+            continue
+        values = [graph.nodes[node][col] for node in nodes]
+        column = numpy.array(values)
+        if column.dtype.kind not in "iufb":
+            column = numpy.array([str(value) for value in values])
+        arrays[level + "_column_" + col] = column
+
+    return arrays
+
+# get_parents
+# Return the index of the outer node with the same value for each inner node,
+# or -1 if there is none
+def get_parents(inner_column, outer_column):
+    outer_index = {value : i for i, value in enumerate(outer_column.tolist())}
+    return numpy.array([outer_index.get(value, -1)
+        for value in inner_column.tolist()], dtype = numpy.int32)
+
+# get_members
+# Return the inner nodes sorted by their parent along with the index in that
+# array where the members of each outer node start. Inner nodes without a 
+# parent are placed before the members of the first outer node.
+def get_members(parents, outer_num):
+    members = numpy.argsort(parents, kind = "stable").astype(numpy.int32)
+    indptr = numpy.searchsorted(parents[members], 
+        numpy.arange(outer_num + 1)).astype(numpy.int32)
+    return members, indptr
+
+# get_file_stamp
+# Return the size and time of last change, in nanoseconds, of the given file
+def get_file_stamp(filename):
+    info = os.stat(filename)
+    return numpy.array([info.st_size, info.st_mtime_ns], dtype = numpy.int64)
+
+# snapshot_matches
+# Return whether or not the snapshot folder holds a snapshot of the current 
+# graph file. A snapshot without a stamp only matches when there is no graph
+# file to compare it with.
+def snapshot_matches(snapshot_folder, graph_dump):
+    if snapshot_folder is None or not os.path.isdir(snapshot_folder):
+        return False
+    if graph_dump is None or not os.path.isfile(graph_dump):
+        return True
+
+    stamp_file = os.path.join(snapshot_folder, "source_stamp.npy")
+    if not os.path.isfile(stamp_file):
+        print("Snapshot", snapshot_folder, "has no stamp, using", graph_dump)
+        return False
+    if not numpy.array_equal(numpy.load(stamp_file), 
+        get_file_stamp(graph_dump)):
+        print("Snapshot", snapshot_folder, "is out of date, using", 
+            graph_dump)
+        return False
+    return True
+
+# read_snapshot
+# Return a dictionary mapping the name of each array in the snapshot folder to
+# the array. By default the arrays are memory-mapped rather than read.
+def read_snapshot(snapshot_folder, mmap_mode = "r"):
+    snapshot = dict()
+    for file in os.listdir(snapshot_folder):
+        if file.endswith(".npy"):
+            snapshot[file[:-4]] = numpy.load(
+                os.path.join(snapshot_folder, file), mmap_mode = mmap_mode)
+    return snapshot
+
+# snapshot_to_graph
+# Return a view of the graph for the given level in a snapshot
+def snapshot_to_graph(snapshot, level):
+    return SnapshotGraph(snapshot, level)
+
+class SnapshotGraph:
+
+    # __init__
+    # Create a view of the graph for the given level over the arrays of a 
+    # snapshot. Nothing is read from the arrays until it is asked for.
+    def __init__(self, snapshot, level):
+        self.node_array = snapshot[level + "_nodes"]
+        self.indptr = snapshot[level + "_indptr"]
+        self.indices = snapshot[level + "_indices"]
+        self.ordered = bool(snapshot[level + "_ordered"])
+
+        prefix = level + "_column_"
+        self.columns = {name[len(prefix):] : snapshot[name]
+            for name in snapshot if name.startswith(prefix)}
+
+        # The nodes are usually numbered 0 to n - 1, in which case the index
+        # of a node in the arrays is the node itself
+        size = len(self.node_array)
+        self.position = None
+        if size != 0 and not (self.node_array[0] == 0 and 
+            self.node_array[-1] == size - 1):
+            self.position = {node : i 
+                for i, node in enumerate(self.node_array.tolist())}
+
+        self.neighbor_table = SnapshotNeighbors(self)
+        self.attribute_table = dict()
+        self.population_tables = dict()
+        self.frame = None
+
+    # index
+    # Return the index in the arrays of the given node
+    def index(self, node):
+        if self.position is None:
+            return node
+        return self.position[node]
+
+    # __len__
+    # Return the number of nodes
+    def __len__(self):
+        return len(self.node_array)
+
+    # __iter__
+    # Iterate over the nodes
+    def __iter__(self):
+        if self.position is None:
+            return iter(range(len(self.node_array)))
+        return iter(self.position)
+
+    # __contains__
+    # Return whether or not the node is in the graph
+    def __contains__(self, node):
+        if self.position is None:
+            return isinstance(node, int) and 0 <= node < len(self.node_array)
+        return node in self.position
+
+    # __getitem__
+    # Return the neighbors of the node, in their cyclic order if it is known
+    def __getitem__(self, node):
+        return self.neighbor_table[node]
+
+    # neighbors
+    # Iterate over the neighbors of the node
+    def neighbors(self, node):
+        return iter(self.neighbor_table[node])
+
+    # nodes
+    # Return a view of the nodes and their attributes
+    @property
+    def nodes(self):
+        return SnapshotNodes(self)
+
+    # edges
+    # Return every edge once, with the endpoint that comes first in the arrays
+    # given first
+    def edges(self):
+        starts = numpy.repeat(numpy.arange(len(self.node_array)),
+            numpy.diff(self.indptr))
+        ends = numpy.asarray(self.indices)
+        keep = starts < ends
+        starts = self.node_array[starts[keep]].tolist()
+        ends = self.node_array[ends[keep]].tolist()
+        return list(zip(starts, ends))
+
+    # number_of_nodes
+    # Return the number of nodes
+    def number_of_nodes(self):
+        return len(self.node_array)
+
+    # attributes
+    # Return the attributes of the node as a dictionary. The cyclic order of
+    # its neighbors is included if it was stored.
+    def attributes(self, node):
+        if node not in self.attribute_table:
+            i = self.index(node)
+            attributes = {col : values[i].item() 
+                for col, values in self.columns.items()}
+            if self.ordered:
+                attributes["neighbor_order"] = list(self.neighbor_table[node])
+            self.attribute_table[node] = attributes
+        return self.attribute_table[node]
+
+    # search_tables
+    # Return the neighbors, population and cyclic order of the neighbors of
+    # every node as they are used by a search state. The neighbors are read 
+    # from the arrays as they are first asked for and shared by every search
+    # state over the graph. The neighbors are stored in their cyclic order, so
+    # the same table gives both if the order is known.
+    def search_tables(self, pop_col):
+        if pop_col not in self.population_tables:
+            self.population_tables[pop_col] = dict(zip(
+                self.node_array.tolist(), self.columns[pop_col].tolist()))
+        neighbor_order = None
+        if self.ordered:
+            neighbor_order = self.neighbor_table
+        return (self.neighbor_table, self.population_tables[pop_col], 
+            neighbor_order)
+
+    # subgraph
+    # Return a graph of the given nodes and the edges between them, with the
+    # attributes of every node
+    def subgraph(self, nodes):
+        nodes = set(nodes)
+        graph = Graph()
+        for node in nodes:
+            graph.add_node(node, **self.attributes(node))
+        graph.add_edges_from((node, neighbor) for node in nodes
+            for neighbor in self.neighbor_table[node] if neighbor in nodes)
+        return graph
+
+    # data
+    # Return the columns of the graph as a data frame indexed by node
+    @property
+    def data(self):
+        if self.frame is None:
+            self.frame = pandas.DataFrame({col : numpy.asarray(values)
+                for col, values in self.columns.items()}, 
+                index = self.node_array.tolist())
+        return self.frame
+
+class SnapshotNodes:
+
+    # __init__
+    # Create a view of the nodes of a snapshot graph
+    def __init__(self, graph):
+        self.graph = graph
+
+    # __call__
+    # Return the view itself, or the value of the given column for every node
+    # if data is given, as the node view of a networkx graph does
+    def __call__(self, data = None):
+        if data is None:
+            return self
+        values = self.graph.columns[data].tolist()
+        return list(zip(self.graph.node_array.tolist(), values))
+
+    # __len__
+    # Return the number of nodes
+    def __len__(self):
+        return len(self.graph)
+
+    # __iter__
+    # Iterate over the nodes
+    def __iter__(self):
+        return iter(self.graph)
+
+    # __contains__
+    # Return whether or not the node is in the graph
+    def __contains__(self, node):
+        return node in self.graph
+
+    # __getitem__
+    # Return the attributes of the node
+    def __getitem__(self, node):
+        return self.graph.attributes(node)
+
+class SnapshotNeighbors(dict):
+
+    # __init__
+    # Create a table of the neighbors of the nodes of a snapshot graph
+    def __init__(self, graph):
+        super().__init__()
+        self.graph = graph
+
+    # __missing__
+    # Read the neighbors of a node from the arrays the first time they are 
+    # asked for
+    def __missing__(self, node):
+        graph = self.graph
+        i = graph.index(node)
+        neighbors = graph.indices[graph.indptr[i]:graph.indptr[i + 1]]
+        if graph.position is None:
+            neighbors = tuple(neighbors.tolist())
+        else:
+            neighbors = tuple(graph.node_array[neighbors].tolist())
+        self[node] = neighbors
+        return neighbors
+
+# snapshot_to_conversions
+# Return level_conversions built from the members stored in a snapshot without
+# looking at the graphs
+def snapshot_to_conversions(snapshot, muni_col):
+    level_conversions = []
+    for inner, outer, col in CONVERSIONS:
+        name = inner + "_" + outer
+        inner_nodes = snapshot[inner + "_nodes"][snapshot[name + "_members"]]
+        inner_nodes = inner_nodes.tolist()
+        indptr = snapshot[name + "_indptr"].tolist()
+
+        conversion = dict()
+        for i, node in enumerate(snapshot[outer + "_nodes"].tolist()):
+            conversion[node] = set(inner_nodes[indptr[i]:indptr[i + 1]])
+        level_conversions.append(conversion)
+
+    return level_conversions + [muni_col]
+
+# read_snapshot_graphs
+# Return the list of graphs [county, muni, vtd] stored in the snapshot folder
+# along with the level_conversions between them
+def read_snapshot_graphs(snapshot_folder, muni_col):
+    snapshot = read_snapshot(snapshot_folder)
+    graph_list = [snapshot_to_graph(snapshot, level) for level in LEVELS]
+    return graph_list, snapshot_to_conversions(snapshot, muni_col)
@@ -11,13 +11,34 @@ This file is used to give the correct file paths to create_ensemble.py
 '''
 
 # New_graphs
+# If graph_cache is not None this is not used, since the cache builds the graphs
+# whenever they are missing
 new_graphs = False
 
+# Graph Cache
+# Folder holding the graphs built from the shapefiles, kept by the content of
+# the files and the columns used to build them. If this is not None, the graphs
+# are taken from the cache, only the graphs whose data has changed are built 
+# again, and graph_dump and graph_snapshot are not used. Input files for the 
+# same state can share a cache.
+graph_cache = None
+
 # Graph File
 # This file must have been previously generated by pickling. If new_graphs is 
 # False this data will be used. Otherwise data will be pulled from the shapefiles
 graph_dump = "Test.dump"
 
+# Graph Snapshot
+# Folder holding the compiled snapshot of the graphs. It is written alongside 
+# the graph file and, if it exists, is loaded instead of the graph file.
+graph_snapshot = "Test_snapshot"
+
+# Template File
+# File holding the split templates made by running split_templates.py. If it 
+# exists, counties and municipalities are split with a template whenever one
+# fits before searching for a split.
+template_file = "Test_templates.dump"
+
 # SHP file with vtds
 vtd_file  = r'C:\Users\charl\Box\Internships\Gerry Chain 2\States\Pennsylvania\2021 Data Set 2 Edited\PA_2020_vtds.shp'
 
@@ -34,6 +55,12 @@ folder = 'Testing'
 # File name
 filename = "Test_1"
 
+# Write Shapefile
+# If this is True, each plan is also written as a shapefile of the VTDs in 
+# vtd_file beside its CSV. The VTDs are taken from the layer cache in 
+# graph_cache if there is one.
+write_shapefile = False
+
 # GEOID Column
 geoid_col = 'GEOID20'
 
@@ -74,9 +101,51 @@ district_num = 10
 # Number of plans
 runs = 1
 
+# Seed
+# Each plan is created from a seed made from this value and the number of the
+# plan, so the same plans are created no matter how many workers are used
+seed = 0
+
+# Workers
+# The number of processes used to create plans at the same time. If this is 1
+# the plans are created one after another.
+workers = 1
+
+# Race
+# If this is greater than 0, a single plan is created by starting this many 
+# searches with different seeds on the workers and keeping the first to finish.
+# The outcome and time of every search is written next to the plan.
+race = 0
+
 # DOF Max
 # The maximum number of nodes at a given divided level (county, muni, or vtd) 
 # that any additional node may be from first node allocated to that district.
 # This parameter is not used to restrict the plan and should be kept arbitrarily
 # high. If this parameter is too low it may cause unexpected behavior
-dof_max = 50
\ No newline at end of file
+dof_max = 50
+
+# Restart Budget
+# The number of nodes a search may try before it gives up and starts over with
+# a new random order. Each restart is given this budget times the next value of
+# the Luby sequence (1, 1, 2, 1, 1, 2, 4, ...), so no plan that can be found is
+# ruled out. If this is None the search never restarts.
+restart_budget = None
+
+# Split Method
+# How counties and municipalities are split when no template fits. With 
+# "search" the lower level is searched one node at a time. With "tree" random
+# spanning trees of the lower level are cut first, as ReCom does, and the lower
+# level is only searched if none of them give a valid split.
+split_method = "search"
+
+# Reuse Splits
+# If this is True, the splits of counties and municipalities found while 
+# searching are kept and tried again when the same node is split from the same
+# entry while backing up. Checking a kept split costs about as much as the 
+# search it saves on the maps it has been tried on, so this is off by default.
+reuse_splits = False
+
+# Template Samples
+# The number of pieces grown for each county and municipality by 
+# split_templates.py
+template_samples = 100
\ No newline at end of file
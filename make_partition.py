@@ -32,8 +32,7 @@ def make_partition(graph, district_num, assignment_col, my_updaters):
         updaters = my_updaters)
 
     # Return the district of every node to 1 (unassigned)
-    for node in flipped_nodes:
-        partition = partition.flip({node : 1})
+    partition = partition.flip(dict.fromkeys(flipped_nodes, 1))
 
     return partition
 
@@ -19,6 +19,8 @@ use edges as limiter instead of nodes
 would allow for disuse of updaters?
 """
 
+from search_state import SearchState
+
 # next_node
 # Give a partiton and node create a dictionary mapping the distance away from 
 # the first node in the district to the unallocated nodes that currently border
@@ -27,6 +29,19 @@ def next_node(partition, nodes, district, dof_dictionary, allowed_nodes):
 
     # Create empty dictionaries for nodes that border the district
     bordering_nodes = dict()
+
+    # Search states keep the unallocated nodes bordering each district, so only
+    # the edges of those nodes need to be checked
+    if isinstance(partition, SearchState):
+        for node in partition.bordering_nodes(district):
+            if node in allowed_nodes:
+                for neighbor in partition.neighbors[node]:
+                    if neighbor in nodes:
+                        index = dof_dictionary[neighbor] + 1
+                        if index not in bordering_nodes:
+                            bordering_nodes[index] = set()
+                        bordering_nodes[index].add(node)
+        return bordering_nodes
    
     # Loop through the cut edges
     for edge in partition["cut_edges"]:
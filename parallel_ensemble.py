@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+parallel_ensemble.py
+
+Created by Charlie Murphy
+18 October 2026
+
+This file generates the plans of an ensemble either one after another or with
+a pool of worker processes. Every run seeds the random number generator from
+the ensemble seed and the run number, so a run produces the same plan no matter
+how many workers are used or which worker it is given to. Along with each plan,
+the time it took and the number of times its search was restarted are given.
+'''
+
+from create_map import create_map, search_budget
+from graph_snapshot import read_snapshot_graphs, snapshot_matches
+from multiprocessing import Pool
+import pickle
+import random
+from reusable_data_2 import get_county_subgraphs
+from search_state import SearchState, get_unallocated_states
+from split_templates import load_templates
+import time
+
+# The partitions and level conversions loaded by each worker process
+worker_inputs = dict()
+
+# get_run_seed
+# Return the seed for the given run of the ensemble
+def get_run_seed(seed, run):
+    return str(seed) + "-" + str(run)
+
+# generate_plans
+# Create the plans of the ensemble one after another, yielding the run number,
+# the plan, the time it took and the number of restarts as each one is 
+# completed
+def generate_plans(county_partition, muni_partition, vtd_partition, county_col,
+    muni_col, pop_col, starting_node, population_deviation, district_num,
+    ideal_population, dof_max, level_conversions, counties, assignment_col,
+    runs, seed, restart_budget, split_method, reuse_splits):
+
+    for run in range(runs):
+        t0 = time.time()
+        random.seed(get_run_seed(seed, run))
+        partition = create_map(county_partition, muni_partition, vtd_partition,
+            county_col, muni_col, pop_col, starting_node, population_deviation,
+            district_num, ideal_population, dof_max, level_conversions,
+            counties, assignment_col, restart_budget, split_method, 
+            reuse_splits)
+        yield run, partition, time.time() - t0, search_budget["restarts"]
+
+# generate_plans_parallel
+# Create the plans of the ensemble with a pool of worker processes, yielding
+# the run number, the plan, the time it took and the number of restarts in the
+# order the plans are completed. Each worker loads the graphs once from the 
+# snapshot or graph file, along with the split templates if there are any. 
+# The plans are returned as search states over the given VTD graph.
+def generate_plans_parallel(vtd_graph, graph_snapshot, graph_dump, 
+    template_file, county_col, muni_col, pop_col, starting_node, 
+    population_deviation, district_num, ideal_population, dof_max, 
+    assignment_col, runs, seed, workers, restart_budget, split_method,
+    reuse_splits):
+
+    with Pool(workers, initializer = init_worker, initargs = (graph_snapshot,
+        graph_dump, template_file, county_col, muni_col, pop_col, 
+        district_num, assignment_col)) as pool:
+
+        tasks = [(run, starting_node, population_deviation, ideal_population,
+            dof_max, seed, restart_budget, split_method, reuse_splits) 
+            for run in range(runs)]
+
+        for run, assignment, seconds, restarts in pool.imap_unordered(
+            run_plan, tasks):
+            partition = None
+            if assignment is not None:
+                partition = SearchState(vtd_graph, assignment, pop_col)
+            yield run, partition, seconds, restarts
+
+# race_plan
+# Start a search for each of the given number of runs with a pool of worker
+# processes and return the first valid plan to be completed. The remaining 
+# searches are cancelled once a plan is found. Along with the run number of 
+# the plan and the plan itself, a list of statistics is returned giving the
+# run number, outcome ("valid", "failed" or "cancelled"), time and number of 
+# restarts of every search. Cancelled searches are given the time until the 
+# race ended and no number of restarts.
+def race_plan(vtd_graph, graph_snapshot, graph_dump, template_file, county_col,
+    muni_col, pop_col, starting_node, population_deviation, district_num,
+    ideal_population, dof_max, assignment_col, candidates, seed, workers,
+    restart_budget, split_method, reuse_splits):
+
+    t0 = time.time()
+    winner = None
+    partition = None
+    stats = dict()
+
+    with Pool(workers, initializer = init_worker, initargs = (graph_snapshot,
+        graph_dump, template_file, county_col, muni_col, pop_col, 
+        district_num, assignment_col)) as pool:
+
+        tasks = [(run, starting_node, population_deviation, ideal_population,
+            dof_max, seed, restart_budget, split_method, reuse_splits) 
+            for run in range(candidates)]
+
+        for run, assignment, seconds, restarts in pool.imap_unordered(
+            run_plan, tasks):
+            if assignment is None:
+                stats[run] = (run, "failed", seconds, restarts)
+                continue
+            stats[run] = (run, "valid", seconds, restarts)
+            winner = run
+            partition = SearchState(vtd_graph, assignment, pop_col)
+            break
+
+        # Leaving the pool terminates the workers still searching
+        seconds = time.time() - t0
+        for run in range(candidates):
+            if run not in stats:
+                stats[run] = (run, "cancelled", seconds, None)
+
+    return winner, partition, [stats[run] for run in range(candidates)]
+
+# init_worker
+# Load the graphs, partitions, level conversions and split templates used by a
+# worker process
+def init_worker(graph_snapshot, graph_dump, template_file, county_col, 
+    muni_col, pop_col, district_num, assignment_col):
+
+    # Load the graphs from the snapshot if it was written for the current 
+    # graph file, or else from the graph file
+    if snapshot_matches(graph_snapshot, graph_dump):
+        graph_list, level_conversions = read_snapshot_graphs(graph_snapshot,
+            muni_col)
+    else:
+        graph_list = pickle.load(open(graph_dump, "rb"))
+        level_conversions = [
+            get_county_subgraphs(graph_list[0], graph_list[1], county_col),
+            get_county_subgraphs(graph_list[0], graph_list[2], county_col),
+            get_county_subgraphs(graph_list[1], graph_list[2], muni_col),
+            muni_col]
+
+    load_templates(template_file, graph_dump)
+
+    partitions = get_unallocated_states(graph_list, pop_col)
+
+    worker_inputs.update({"partitions" : partitions,
+        "level_conversions" : level_conversions,
+        "counties" : set(graph_list[0].nodes()), "county_col" : county_col,
+        "muni_col" : muni_col, "pop_col" : pop_col,
+        "district_num" : district_num, "assignment_col" : assignment_col})
+
+# run_plan
+# Create the plan for a single run in a worker process and return the run
+# number, the assignment of the plan, the time it took and the number of 
+# restarts
+def run_plan(task):
+    run, starting_node, population_deviation, ideal_population, dof_max, \
+        seed, restart_budget, split_method, reuse_splits = task
+
+    t0 = time.time()
+    random.seed(get_run_seed(seed, run))
+    partitions = worker_inputs["partitions"]
+    partition = create_map(partitions[0], partitions[1], partitions[2],
+        worker_inputs["county_col"], worker_inputs["muni_col"],
+        worker_inputs["pop_col"], starting_node, population_deviation,
+        worker_inputs["district_num"], ideal_population, dof_max,
+        worker_inputs["level_conversions"], worker_inputs["counties"],
+        worker_inputs["assignment_col"], restart_budget, split_method, 
+        reuse_splits)
+
+    assignment = None
+    if partition is not None:
+        assignment = dict(partition.assignment)
+    return run, assignment, time.time() - t0, search_budget["restarts"]
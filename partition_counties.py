@@ -276,27 +276,19 @@ def get_next_county(partition, counties, county_to_id, id_to_county, district,
     # Create empty dictionaries for counties that border the district
     bordering_counties = dict()
    
-    # Loop through the cut edges
-    for edge in partition["cut_edges"]:
-
-        # Create a tuple of the districts and counties on each side of each 
-        # cut edge
-        edge_districts = (partition.assignment[edge[0]], 
-            partition.assignment[edge[1]])
-        edge_counties = (edge[0], edge[1])
-
-        # Keep if the edge has one node in the current district and one node
-        # that has yet to been assigned
-        if edge_districts in [(1, district), (district, 1)]:
-
-            # Map each bordering county to the number of nodes it is away from 
-            # the first node placed for said district
-            for i in range(2):
-                if edge[i] in counties:
-                    index = dof_dictionary[edge[i]] + 1
-                    if index not in bordering_counties:
-                        bordering_counties[index] = set()
-                    bordering_counties[index].add(edge[i - 1])
-                    break
+    # Loop through the counties in the current district instead of every cut
+    # edge, since only their edges can border the district
+    for county in set(counties):
+        if partition.assignment[county] != district:
+            continue
+
+        # Map each bordering county that has yet to be assigned to the number 
+        # of nodes it is away from the first node placed for said district
+        for neighbor in partition.graph.neighbors(county):
+            if partition.assignment[neighbor] == 1:
+                index = dof_dictionary[county] + 1
+                if index not in bordering_counties:
+                    bordering_counties[index] = set()
+                bordering_counties[index].add(neighbor)
                     
     return bordering_counties
\ No newline at end of file
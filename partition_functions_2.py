@@ -12,11 +12,15 @@ partition_municipalities.py to increase the modularity of both programs.
 '''
 
 from networkx import number_connected_components
+from search_state import SearchState, find_cut_nodes
 
 # check_contiguous
 # Return whether or not the unallocated nodes are contiguous within the given 
-# partition
+# partition. Search states answer this from the cut nodes of the unallocated
+# nodes rather than counting the connected components.
 def check_contiguous(partition):
+    if isinstance(partition, SearchState):
+        return partition.unallocated_contiguous()
     return check_contiguous_district(partition, 1)
 
 # check_contiguous_district
@@ -50,6 +54,21 @@ def get_pieces(partition):
 def check_population(population, ideal_population, population_deviation):
     return abs(population - ideal_population) <= population_deviation
 
+# check_remaining_population
+# Return whether or not the unallocated population of the partition is enough
+# to finish the current district and fill every district after it up to the
+# district_num. Each of these districts needs at least its goal less the 
+# population deviation. The unallocated nodes left over once they are filled 
+# form the final district, to which epsilon does not apply, so there is no 
+# upper bound. The population of the unallocated nodes is kept by the 
+# partition, so this does not depend on the size of the map.
+def check_remaining_population(partition, goals, district, population, 
+    population_deviation, district_num):
+    needed = goals[district - 1] - population - population_deviation
+    for i in range(district, district_num):
+        needed += goals[i] - population_deviation
+    return partition["population"].get(1, 0) >= needed
+
 # safe_add
 # Add (key, entry) pair to dictionary where the entry is added to the existing 
 # entry if the key already exists
@@ -60,15 +79,94 @@ def safe_add(dictionary, key, entry):
         dictionary[key] = entry
 
 # Check whether the node allocated is adjacent to a node that was split and thus
-# would require additional contiguity checks
-def check_split_nodes(partitions, level, split_nodes, node, district):
+# would require additional contiguity checks. For search states only the VTDs 
+# of the node are checked when the district is known to have been contiguous 
+# before the node was added, which is looked up by the markers taken then.
+def check_split_nodes(partitions, level, split_nodes, node, district, 
+    level_conversions, marks = None):
     if level!=2 and node in split_nodes[level]:
+        if isinstance(partitions[2], SearchState):
+            vtd_nodes = level_conversions[1 if level == 0 else 2][node]
+            previous_id = None
+            if marks is not None:
+                previous_id = partitions[2].state_id(marks[2])
+            return check_attached(partitions[2], vtd_nodes, district, 
+                previous_id)
         return check_contiguous_district(partitions[2], district)
     return True
 
+# check_attached
+# Return whether or not the district is contiguous after the given nodes were
+# added to it. If the district was contiguous in the state with the given id,
+# this is the case when every connected group of the nodes now in the district
+# borders a node of the district outside of them, so only the nodes and their
+# neighbors are looked at. A group that borders none of the district always
+# leaves it discontiguous. Otherwise, the whole district is checked. Districts
+# found to be contiguous are recorded so the next check can be local.
+def check_attached(partition, nodes, district, previous_id):
+    partition.materialize()
+    assignment = partition.assignment
+    neighbors = partition.neighbors
+    region = set(node for node in nodes if assignment[node] == district)
+    if len(region) != 0 and len(region) == len(partition.parts[district]):
+        return remember_district(partition, district, 
+            find_cut_nodes(neighbors, region)[0])
+    if not attached_groups(assignment, neighbors, region, district):
+        return False
+
+    if partition.known_district_contiguous(previous_id, district):
+        return remember_district(partition, district, True)
+    district_nodes = partition.parts.get(district, set())
+    if len(district_nodes) == 0:
+        return True
+    return remember_district(partition, district, 
+        find_cut_nodes(neighbors, district_nodes)[0])
+
+# remember_district
+# Record the district of the search state if it is contiguous and return the
+# result of the check
+def remember_district(partition, district, contiguous):
+    if contiguous:
+        partition.remember_district_contiguous(district)
+    return contiguous
+
+# attached_groups
+# Return whether or not every connected group of the region borders a node of
+# the district outside of the region
+def attached_groups(assignment, neighbors, region, district):
+
+    # Search each connected group of the region for a neighbor in the district
+    # outside of the nodes
+    unvisited = set(region)
+    while unvisited:
+        start = unvisited.pop()
+        stack = [start]
+        attached = False
+        while stack:
+            node = stack.pop()
+            for neighbor in neighbors[node]:
+                if neighbor in unvisited:
+                    unvisited.remove(neighbor)
+                    stack.append(neighbor)
+                elif (not attached and neighbor not in region and 
+                    assignment[neighbor] == district):
+                    attached = True
+        if not attached:
+            return False
+    return True
+
 # After splitting a node, get a list of all of the adjacent nodes
 def get_split_nodes(partitions, level, split_nodes, node):
-    for edge in partitions[level]["cut_edges"]:
+    partition = partitions[level]
+
+    # Search states only need to check the neighbors of the node
+    if isinstance(partition, SearchState):
+        for neighbor in partition.neighbors[node]:
+            if partition.assignment[neighbor] != partition.assignment[node]:
+                split_nodes[level].add(neighbor)
+        return split_nodes
+
+    for edge in partition["cut_edges"]:
         for i in range(0,2):
             if edge[i] == node:
                 split_nodes[level].add(edge[i-1])
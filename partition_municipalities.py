@@ -19,6 +19,7 @@ from networkx import number_connected_components
 from partition_functions import (get_county_nodes, check_population, 
     add_to_assignment, check_contiguous, get_pieces, check_borders)
 import random
+from search_state import check_local_contiguous, LOCAL_SEARCH_SIZE
 from write_partition import write_to_shapefile
 
 # partition_municipalities
@@ -179,8 +180,10 @@ def attempt_muni_partition(partition, muni_assignments, county, districts,
         return True, muni_assignments, districts_used, full_partition
 
     # Continue adding municipalities until every district has enough population
-    # allocated to it.
+    # allocated to it. The unallocated municipalities of the partition are only
+    # known to be contiguous once a municipality has passed the check below.
     count = 0
+    partition_contiguous = False
     while True:
         count += 1
 
@@ -219,7 +222,9 @@ def attempt_muni_partition(partition, muni_assignments, county, districts,
 
                 # Check whether this addition preserves the contiguity of the
                 # plan. Note: may be issue when district = 1
-                if validity and unused_contiguous(proposed_partition):
+                if validity and unused_contiguous(proposed_partition,
+                    partition if partition_contiguous else None):
+                    partition_contiguous = True
                     partition = proposed_partition
                     munis = proposed_munis
                     muni_assignments = proposed_muni_assignments
@@ -410,37 +415,44 @@ def get_next_muni(partition, munis, muni_to_id, id_to_muni, district, county,
 
     # Create empty dictionaries for counties that border the district
     bordering_munis = dict()
+    nodes = partition.graph.nodes
    
-    # Loop through the cut edges
-    for edge in partition["cut_edges"]:
-
-        # Create a tuple of the districts and counties on each side of each 
-        # cut edge
-        edge_districts = (partition.assignment[edge[0]], 
-            partition.assignment[edge[1]])
-        edge_munis = (edge[0], edge[1])
-        edge_counties = (partition.graph.nodes[edge[0]][county_col], 
-            partition.graph.nodes[edge[1]][county_col])
-
-        # Keep if the edge has one node in the current district and one node
-        # that has yet to been assigned
-        if (edge_counties == (county, county) and 
-            edge_districts in [(1, district), (district, 1)]):
-
-            for i in range(2):
-                if edge[i] in munis:
-                    index = dof_dictionary[edge[i]] + 1
-                    if index not in bordering_munis:
-                        bordering_munis[index] = set()
-                    bordering_munis[index].add(edge[i - 1])
-                    break
+    # Loop through the municipalities in the current district instead of every
+    # cut edge, since only their edges can border the district
+    for muni in set(munis):
+        if (partition.assignment[muni] != district or 
+            nodes[muni][county_col] != county):
+            continue
+
+        # Keep the neighbors in the same county that have yet to be assigned
+        for neighbor in partition.graph.neighbors(muni):
+            if (partition.assignment[neighbor] == 1 and 
+                nodes[neighbor][county_col] == county):
+                index = dof_dictionary[muni] + 1
+                if index not in bordering_munis:
+                    bordering_munis[index] = set()
+                bordering_munis[index].add(neighbor)
 
     return bordering_munis
 
 # unused_continguous
 # Return whether or not the unallocated municipalities are contiguous within the
-# given partition
-def unused_contiguous(partition):
+# given partition. If the unallocated municipalities of previous_partition are
+# known to be contiguous and the partition only moved one municipality out of
+# them, the local test around that municipality is tried first.
+def unused_contiguous(partition, previous_partition = None):
+    if (previous_partition is not None and 
+        partition.parent is previous_partition and len(partition.flips) == 1):
+        muni, district = next(iter(partition.flips.items()))
+        node_data = partition.graph.nodes[muni]
+        if (previous_partition.assignment[muni] == 1 and district != 1 and
+            "neighbor_order" in node_data):
+            contiguous = check_local_contiguous(muni, 
+                node_data["neighbor_order"], partition.graph.adj, 
+                partition.parts[1], LOCAL_SEARCH_SIZE)
+            if contiguous is not None:
+                return contiguous
+
     for part, subgraph in partition.subgraphs.items():
         if (part == 1 and 
             number_connected_components(subgraph) != 1): 
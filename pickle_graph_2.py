@@ -8,43 +8,115 @@ Created by Charlie Murphy
 7 November 2021
 
 This file pickles graph objects so that they can be used successively by the
-algorithm without having to be regenerated.
+algorithm without having to be regenerated. If a graph cache is given, each 
+graph is taken from the cache when the files and settings it is built from 
+have not changed, so only the graphs whose data has changed are built again.
 '''
 
+from discontiguous_counties import (correct_PA, check_contiguity, 
+    muni_over_county)
 from fix_donuts import fix_donuts
+from gerrychain import Graph
+from graph_cache import (get_graph_keys, get_graph_paths, load_graph, 
+    store_graph)
+from graph_snapshot import write_snapshot
+import os
+import pickle
+from read_layers import read_layer
+from reusable_data_2 import get_neighbor_order
 
-# Load Data
-data_county = geopandas.read_file(county_file)
-data_vtd = geopandas.read_file(vtd_file)
+# Columns kept when reading the shapefiles
+layer_columns = [county_col, geoid_col, muni_col, name_col, pop_col]
 
-# Fix Donuts
-data_muni, data_vtd = fix_donuts(county_file, muni_file, vtd_file, 
-    assignment_col, county_col, geoid_col, muni_col, name_col, pop_col, 
-    geom_col)
-data_muni = data_muni.reset_index()
+# Columns kept in the snapshot
+snapshot_columns = [pop_col, county_col, muni_col, geoid_col, name_col, 
+    assignment_col]
 
-# Add assignment column
-data_county[assignment_col] = 1
-data_muni[assignment_col] = 1
-data_vtd[assignment_col] = 1
+# Load the graphs that are already in the cache. The graph file and snapshot 
+# are kept in the cache as well.
+county_graph = muni_graph = vtd_graph = None
+if graph_cache is not None:
+    graph_keys = get_graph_keys(graph_cache, county_file, muni_file, vtd_file,
+        assignment_col, county_col, geoid_col, muni_col, name_col, pop_col, 
+        geom_col)
+    graph_dump, graph_snapshot = get_graph_paths(graph_cache, graph_keys)
 
-# Create Graphs
-county_graph = Graph.from_geodataframe(data_county)
-muni_graph = Graph.from_geodataframe(data_muni)
-vtd_graph = Graph.from_geodataframe(data_vtd)
+    county_graph = load_graph(graph_cache, "county", graph_keys["county"])
+    muni_graph = load_graph(graph_cache, "muni", graph_keys["muni"])
+    vtd_graph = load_graph(graph_cache, "vtd", graph_keys["vtd"])
 
-# Make sure that the precincts of every county are contiguous. This line is 
-# specific to PA
-vtd_graph = correct_PA(vtd_graph, geoid_col, assignment_col)
+# Load Data. Each shapefile is read once, keeping only the columns that are 
+# used, and the same data is used to fix donuts and build the graphs. The 
+# layers are taken from the graph cache if there is one.
+if county_graph is None or muni_graph is None or vtd_graph is None:
+    data_county = read_layer(county_file, layer_columns, graph_cache)
+    data_county[assignment_col] = 1
 
-# Verify that municipalities and counties are made out contiguous districts
-check_contiguity(vtd_graph, data_county, county_col, name_col)
-check_contiguity(vtd_graph, data_muni, muni_col, name_col)
-check_contiguity(muni_graph, data_county, county_col, name_col)
-muni_over_county(muni_graph, muni_col, name_col)
+# Create the county graph
+if county_graph is None:
+    county_graph = Graph.from_geodataframe(data_county)
+    county_graph = get_neighbor_order(county_graph, data_county)
+    if graph_cache is not None:
+        store_graph(county_graph, graph_cache, "county", graph_keys["county"])
+
+# Create the municipality and VTD graphs that are missing
+if muni_graph is None or vtd_graph is None:
+
+    # Fix Donuts
+    data_muni = read_layer(muni_file, layer_columns, graph_cache)
+    data_vtd = read_layer(vtd_file, layer_columns, graph_cache)
+    data_muni, data_vtd = fix_donuts(data_county, data_muni, data_vtd, 
+        county_graph, assignment_col, county_col, geoid_col, muni_col, 
+        name_col, pop_col, geom_col, workers)
+    data_muni = data_muni.reset_index()
+
+    # Add assignment column
+    data_muni[assignment_col] = 1
+    data_vtd[assignment_col] = 1
+
+    # Create the municipality graph, verify that counties are made out of 
+    # contiguous municipalities and store the cyclic order of the neighbors 
+    # around every node. This is used to check contiguity locally while 
+    # searching.
+    if muni_graph is None:
+        muni_graph = Graph.from_geodataframe(data_muni)
+        check_contiguity(muni_graph, data_county, county_col, name_col)
+        muni_over_county(muni_graph, muni_col, name_col)
+        muni_graph = get_neighbor_order(muni_graph, data_muni)
+        if graph_cache is not None:
+            store_graph(muni_graph, graph_cache, "muni", 
+                graph_keys["muni"])
+
+    # Create the VTD graph in the same way
+    if vtd_graph is None:
+        vtd_graph = Graph.from_geodataframe(data_vtd)
+
+        # Make sure that the precincts of every county are contiguous. This 
+        # line is specific to PA
+        vtd_graph = correct_PA(vtd_graph, geoid_col, assignment_col)
+
+        check_contiguity(vtd_graph, data_county, county_col, name_col)
+        check_contiguity(vtd_graph, data_muni, muni_col, name_col)
+        vtd_graph = get_neighbor_order(vtd_graph, data_vtd)
+        if graph_cache is not None:
+            store_graph(vtd_graph, graph_cache, "vtd", graph_keys["vtd"])
 
 # Create list of graphs
 graph_list = [county_graph, muni_graph, vtd_graph]
 
-# Pickle Graphs
-pickle.dump(graph_list, open(graph_dump, 'wb'))
+# Pickle Graphs and write the compiled snapshot of the graphs. Graphs in the 
+# cache are only written if they are not there yet, and the snapshot is 
+# written beside where it goes and then moved into place so that a snapshot 
+# that is only partly written is never loaded.
+if graph_cache is None:
+    with open(graph_dump, 'wb') as file:
+        pickle.dump(graph_list, file)
+    write_snapshot(graph_list, graph_snapshot, snapshot_columns, county_col, 
+        muni_col, graph_dump)
+else:
+    if not os.path.isfile(graph_dump):
+        store_graph(graph_list, graph_cache, "graphs", graph_keys["graphs"])
+    if not os.path.isdir(graph_snapshot):
+        write_snapshot(graph_list, graph_snapshot + ".tmp", snapshot_columns,
+            county_col, muni_col, graph_dump)
+        os.replace(graph_snapshot + ".tmp", graph_snapshot)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+read_layers.py
+
+Created by Charlie Murphy
+18 October 2026
+
+This file reads the county, municipality and VTD shapefiles. Each layer is
+read once and only the columns that are used are kept, so that the same
+GeoDataFrames can be handed to fix_donuts and used to build the graphs. The
+layers are read a column at a time with pyogrio when it is installed, which
+skips the columns that are not used entirely, and with fiona otherwise.
+
+If a cache folder is given, each shapefile is converted the first time it is
+read into a layer cache kept beside the graphs. Like a graph snapshot, a layer
+is a folder of .npy files: one for each column, the geometry as WKB in a single
+byte array with the offset of each shape, and a schema listing the columns and
+their types. The layer is stored under the hash of the shapefile, so it is made
+again whenever the shapefile changes, and only the columns that are asked for
+are loaded.
+'''
+
+from graph_cache import cache_path, get_file_hash, get_key
+import geopandas
+import numpy
+import os
+import pandas
+
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+# read_layer
+# Return a GeoDataFrame of the given shapefile holding those of the given
+# columns that are in the file, along with the geometry. Every column is kept
+# if columns is None. The layer is taken from the layer cache in cache_folder 
+# if one is given.
+def read_layer(filename, columns = None, cache_folder = None):
+    if cache_folder is None:
+        return read_shapefile(filename, columns)
+
+    # Convert the shapefile the first time it is read. The layer is written
+    # beside where it goes and then moved into place so that a layer that is
+    # only partly written is never loaded.
+    layer_folder = cache_path(cache_folder, "layer",
+        get_key(get_file_hash(cache_folder, filename)))
+    if not os.path.isdir(layer_folder):
+        write_layer(read_shapefile(filename, None), layer_folder + ".tmp")
+        os.replace(layer_folder + ".tmp", layer_folder)
+
+    return load_layer(layer_folder, columns)
+
+# read_shapefile
+# Return a GeoDataFrame of the given shapefile in the same way as read_layer,
+# without using the layer cache
+def read_shapefile(filename, columns):
+    if pyogrio is not None:
+        if columns is not None:
+            fields = set(pyogrio.read_info(filename)["fields"])
+            columns = [column for column in columns if column in fields]
+        return geopandas.read_file(filename, engine = "pyogrio",
+            columns = columns)
+
+    data = geopandas.read_file(filename)
+    if columns is not None:
+        data = data[[column for column in data.columns
+            if column in columns or column == data.geometry.name]]
+    return data
+
+# write_layer
+# Write the columns and geometry of a GeoDataFrame to the layer folder
+def write_layer(data, layer_folder):
+    os.makedirs(layer_folder, exist_ok = True)
+
+    columns = [column for column in data.columns
+        if column != data.geometry.name]
+    arrays = {"index" : data.index.to_numpy()}
+
+    # Text is stored as fixed width strings when there are no missing values.
+    # Anything else that numpy cannot store directly is pickled.
+    types = []
+    for i, column in enumerate(columns):
+        values = data[column].to_numpy()
+        if values.dtype == object and all(isinstance(value, str)
+            for value in values):
+            values = values.astype(str)
+        arrays["column_" + str(i)] = values
+        types.append(values.dtype.str)
+
+    # Store every shape as WKB in one byte array. Missing shapes have no bytes.
+    shapes = [shape if shape is not None else b""
+        for shape in data.geometry.to_wkb().tolist()]
+    offsets = numpy.zeros(len(shapes) + 1, dtype = numpy.int64)
+    offsets[1:] = numpy.cumsum([len(shape) for shape in shapes])
+    arrays["geometry"] = numpy.frombuffer(b"".join(shapes),
+        dtype = numpy.uint8)
+    arrays["geometry_offsets"] = offsets
+    arrays["crs"] = numpy.array(data.crs.to_wkt() if data.crs is not None
+        else "")
+    arrays["schema"] = numpy.array([columns, types]).reshape(2, -1)
+
+    for name, array in arrays.items():
+        numpy.save(os.path.join(layer_folder, name + ".npy"), array)
+
+# load_layer
+# Return the given columns of the layer stored in the layer folder, along with
+# the geometry
+def load_layer(layer_folder, columns):
+    path = lambda name: os.path.join(layer_folder, name + ".npy")
+    schema = numpy.load(path("schema")).tolist()
+    index = pandas.Index(numpy.load(path("index"), allow_pickle = True))
+
+    data = pandas.DataFrame(index = index)
+    for i, column in enumerate(schema[0]):
+        if columns is None or column in columns:
+            values = numpy.load(path("column_" + str(i)), allow_pickle = True)
+            if values.dtype.kind == "U":
+                values = values.astype(object)
+            data[column] = values
+
+    shapes = numpy.load(path("geometry"))
+    offsets = numpy.load(path("geometry_offsets")).tolist()
+    shapes = [shapes[offsets[i]:offsets[i + 1]].tobytes() or None
+        for i in range(len(index))]
+    crs = str(numpy.load(path("crs"))) or None
+
+    return geopandas.GeoDataFrame(data, geometry = 
+        geopandas.GeoSeries.from_wkb(shapes, index = index, crs = crs))
@@ -111,13 +111,21 @@ def get_subgraph(graph, county_col, county):
 
 # get_county_subgraphs
 # Returns a dictionary mapping counties to their sugbraphs of nodes in the given
-# partition
+# partition. The nodes are grouped by county in a single pass rather than 
+# searching the graph once for every county.
 def get_county_subgraphs(partition, counties, county_col):
+    groups = dict()
+    for node in partition.nodes:
+        county = partition.nodes[node][county_col]
+        if county not in groups:
+            groups[county] = set()
+        groups[county].add(node)
+
     subgraphs = dict()
 
     # Loop through every county
     for county in counties:
-        subgraphs[county] = get_subgraph(partition, county_col, county)
+        subgraphs[county] = groups.get(county, set())
 
     return subgraphs
 
@@ -12,6 +12,8 @@ same between runs so that by calculating them once the algorithm can run more
 efficiently
 '''
 
+from math import atan2
+
 # ideal_population
 # Calculate the total population of the partition and divide it by the number 
 # of districts
@@ -38,13 +40,57 @@ def get_subgraph(graph, col, benchmark):
 
 # get_county_subgraphs
 # Returns a dictionary mapping counties to their sugbraphs of nodes in the given
-# partition
+# partition. The inner nodes are grouped by the column in a single pass rather
+# than searching the inner graph once for every county.
 def get_county_subgraphs(outer_graph, inner_graph, col):
+    groups = group_nodes(inner_graph, col)
     subgraphs = dict()
 
     # Loop through every county
     for node in outer_graph.nodes:
         benchmark = outer_graph.nodes()[node][col]
-        subgraphs[node] = get_subgraph(inner_graph, col, benchmark)
+        subgraphs[node] = set(groups.get(benchmark, set()))
+
+    return subgraphs
+
+# group_nodes
+# Return a dictionary mapping each value of the column to the set of nodes in
+# the graph with that value
+def group_nodes(graph, col):
+    groups = dict()
+    for node, value in graph.nodes(data = col):
+        if value not in groups:
+            groups[value] = set()
+        groups[value].add(node)
+    return groups
+
+# get_neighbor_order
+# Store the neighbors of every node in the graph in the cyclic order they occur
+# around the node. Each neighbor is placed by the angle from the centroid of the
+# node to a point on the border they share. Neighbors that do not share a 
+# border, such as those joined by correct_PA, are placed by their centroid.
+def get_neighbor_order(graph, data):
+    geometries = data.geometry
+    centroids = {node : geometries[node].centroid for node in graph.nodes}
+    angles = {node : dict() for node in graph.nodes}
+
+    # Loop through every edge once, finding the shared border for both ends
+    for node1, node2 in graph.edges:
+        border = geometries[node1].boundary.intersection(
+            geometries[node2].boundary)
+        if border.is_empty:
+            point1 = centroids[node2]
+            point2 = centroids[node1]
+        else:
+            point1 = point2 = border.representative_point()
+
+        angles[node1][node2] = atan2(point1.y - centroids[node1].y, 
+            point1.x - centroids[node1].x)
+        angles[node2][node1] = atan2(point2.y - centroids[node2].y, 
+            point2.x - centroids[node2].x)
+
+    for node in graph.nodes:
+        graph.nodes[node]["neighbor_order"] = sorted(angles[node], 
+            key = angles[node].get)
 
-    return subgraphs
\ No newline at end of file
+    return graph
\ No newline at end of file
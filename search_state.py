@@ -0,0 +1,615 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+search_state.py
+
+Created by Charlie Murphy
+18 October 2026
+
+This file holds the mutable assignment used while searching for a plan. It
+mirrors the parts of a gerrychain partition that the algorithm reads (the
+assignment, parts, population, cut edges and subgraphs), but flips are made in
+place and recorded in a log so that backing up only undoes the changes made
+since a given point instead of discarding a chain of partitions. Flips pushed
+down from a higher level can be deferred, in which case they are only made 
+once the state is next read or flipped, so the lower levels are not updated for
+allocations that are undone before they are looked at.
+'''
+
+from collections import OrderedDict, deque
+
+# Number of states for which the cut nodes of the unallocated region are kept
+CUT_NODE_CACHE_SIZE = 256
+
+# Number of nodes the local contiguity test may visit before giving up and
+# falling back to the cut nodes of the whole unallocated region
+LOCAL_SEARCH_SIZE = 200
+
+class SearchState:
+
+    # __init__
+    # Create a search state for the given graph and assignment
+    def __init__(self, graph, assignment, pop_col):
+        self.graph = graph
+        self.pop_col = pop_col
+        self.assignment = dict(assignment)
+        self.log = []
+        self.serial = 0
+        self.cut_node_cache = OrderedDict()
+        self.contiguous_states = OrderedDict()
+        self.contiguous_districts = OrderedDict()
+
+        # The deferred flips, as (tag, nodes, district), the number of them 
+        # that have been made, and for every time they were made, the length of
+        # the log beforehand along with the number that had been made before
+        self.pending = []
+        self.applied = 0
+        self.materialized = []
+
+        # Store the neighbors and population of every node so that flips do
+        # not have to go through the graph, along with the cyclic order of the
+        # neighbors around each node if the graph was built with it. A graph 
+        # read from a snapshot gives tables that read the arrays of the 
+        # snapshot as they are used.
+        if hasattr(graph, "search_tables"):
+            self.neighbors, self.node_population, self.neighbor_order = \
+                graph.search_tables(pop_col)
+        else:
+            self.neighbors = {node : tuple(graph[node]) 
+                for node in graph.nodes}
+            self.node_population = {node : graph.nodes[node][pop_col] 
+                for node in graph.nodes}
+            self.neighbor_order = None
+            if all("neighbor_order" in graph.nodes[node] 
+                for node in graph.nodes):
+                self.neighbor_order = {node : 
+                    graph.nodes[node]["neighbor_order"] 
+                    for node in graph.nodes}
+
+        # Group the nodes and population by district. The Zobrist hash of the
+        # assignment is the xor of a hash of every (node, district) pair, so 
+        # it can be updated as each node is moved.
+        self.parts = dict()
+        self.population = dict()
+        self.zobrist = 0
+        for node, district in self.assignment.items():
+            self.zobrist ^= hash((node, district))
+            if district not in self.parts:
+                self.parts[district] = set()
+                self.population[district] = 0
+            self.parts[district].add(node)
+            self.population[district] += self.node_population[node]
+
+        # Find the edges between districts and the frontier of every district.
+        # The frontier maps each district to the unallocated nodes that border
+        # it and how many of their neighbors are in the district. Neither 
+        # exists while every node is in the same district, as when a search 
+        # starts, so the edges are not gone over then.
+        self.cut_edges = set()
+        self.frontier = dict()
+        if len(self.parts) > 1:
+            for edge in graph.edges():
+                if self.assignment[edge[0]] != self.assignment[edge[1]]:
+                    self.cut_edges.add(order_edge(edge[0], edge[1]))
+
+            for node in self.parts.get(1, set()):
+                for neighbor in self.neighbors[node]:
+                    if self.assignment[neighbor] != 1:
+                        increment(self.frontier, self.assignment[neighbor], 
+                            node)
+
+    # __getitem__
+    # Allow the population and cut edges to be read the same way as the
+    # updaters of a gerrychain partition
+    def __getitem__(self, key):
+        self.materialize()
+        if key == "population":
+            return self.population
+        if key == "cut_edges":
+            return self.cut_edges
+        raise KeyError(key)
+
+    # subgraphs
+    # Return a dictionary mapping each district to the subgraph of its nodes
+    @property
+    def subgraphs(self):
+        self.materialize()
+        return {part : self.graph.subgraph(nodes)
+            for part, nodes in self.parts.items()}
+
+    # flip
+    # Move every node in the flips dictionary to its new district, recording
+    # the previous district of each node in the log. Every entry gets its own 
+    # serial number so that the entry at the end of the log identifies the
+    # current state. The state itself is returned so that calls can be written
+    # the same way as for a partition.
+    def flip(self, flips):
+        self.materialize()
+        self.record(flips)
+        return self
+
+    # bordering_nodes
+    # Return a dictionary mapping the unallocated nodes that border the given
+    # district to the number of their neighbors in the district
+    def bordering_nodes(self, district):
+        self.materialize()
+        return self.frontier.get(district, dict())
+
+    # defer
+    # Record that the given nodes are to be moved to the district without
+    # moving them yet. The tag identifies the flip in place of the nodes in
+    # pending_key. The entry in the log for a deferred flip has no node.
+    def defer(self, tag, nodes, district):
+        self.serial += 1
+        self.log.append((None, len(self.pending), self.serial))
+        self.pending.append((tag, nodes, district))
+
+    # materialize
+    # Make every deferred flip that has not been made yet, in the order they 
+    # were deferred
+    def materialize(self):
+        if self.applied == len(self.pending):
+            return
+        self.materialized.append((len(self.log), self.applied))
+        while self.applied < len(self.pending):
+            tag, nodes, district = self.pending[self.applied]
+            self.applied += 1
+            self.record(dict.fromkeys(nodes, district))
+
+    # record
+    # Move every node in the flips dictionary to its new district, recording
+    # the previous district of each node in the log
+    def record(self, flips):
+        targets = dict()
+        for node, district in flips.items():
+            old_district = self.assignment[node]
+            if old_district != district:
+                self.serial += 1
+                self.log.append((node, old_district, self.serial))
+                targets[node] = district
+        self.relocate(targets)
+
+    # relocate
+    # Move every node in targets to its district. A single node is moved on its
+    # own and larger groups are moved together.
+    def relocate(self, targets):
+        if len(targets) == 1:
+            for node, district in targets.items():
+                self.move(node, district)
+        elif len(targets) > 1:
+            self.move_many(targets)
+
+    # move_many
+    # Move every node in targets to its district and update the parts, 
+    # population, Zobrist hash, cut edges and frontiers accordingly. Each node
+    # must be moving to a new district. The edges touching the moved nodes are
+    # gone over once to take out what they add to the cut edges and frontiers,
+    # and once more after the nodes are moved to add it back, so an edge 
+    # between two moved nodes is only updated once rather than once for each
+    # end as it is by move.
+    def move_many(self, targets):
+        assignment = self.assignment
+        neighbors = self.neighbors
+        edges = [(node, neighbor) for node in targets 
+            for neighbor in neighbors[node]
+            if neighbor not in targets or node < neighbor]
+
+        self.change_edges(edges, decrement)
+
+        parts = self.parts
+        population = self.population
+        node_population = self.node_population
+        zobrist = self.zobrist
+        for node, district in targets.items():
+            old_district = assignment[node]
+            if district not in parts:
+                parts[district] = set()
+                population[district] = 0
+            parts[old_district].remove(node)
+            parts[district].add(node)
+            population[old_district] -= node_population[node]
+            population[district] += node_population[node]
+            assignment[node] = district
+            zobrist ^= hash((node, old_district)) ^ hash((node, district))
+        self.zobrist = zobrist
+
+        self.change_edges(edges, increment)
+
+    # change_edges
+    # Add (with increment) or take out (with decrement) what each of the given
+    # edges adds to the cut edges and frontiers under the current assignment
+    def change_edges(self, edges, change):
+        assignment = self.assignment
+        cut_edges = self.cut_edges
+        frontier = self.frontier
+        adding = change is increment
+        for node, neighbor in edges:
+            node_district = assignment[node]
+            neighbor_district = assignment[neighbor]
+            if node_district == neighbor_district:
+                continue
+
+            if adding:
+                cut_edges.add(order_edge(node, neighbor))
+            else:
+                cut_edges.discard(order_edge(node, neighbor))
+
+            # An unallocated end is on the frontier of the other end's district
+            if node_district == 1:
+                if adding:
+                    increment(frontier, neighbor_district, node)
+                else:
+                    decrement(frontier[neighbor_district], node)
+            elif neighbor_district == 1:
+                if adding:
+                    increment(frontier, node_district, neighbor)
+                else:
+                    decrement(frontier[node_district], neighbor)
+
+    # pending_key
+    # Return the tags and districts of the deferred flips that have not been
+    # made yet. Along with the Zobrist hash, this identifies the assignment the
+    # state will have once they are made.
+    def pending_key(self):
+        return tuple((tag, district) for tag, nodes, district in 
+            self.pending[self.applied:])
+
+    # mark
+    # Return a marker for the current point in the log
+    def mark(self):
+        return len(self.log)
+
+    # undo
+    # Undo every flip made since the given marker, moving the nodes back 
+    # together. Deferred flips made since the marker are deferred again, and 
+    # those deferred since are dropped.
+    def undo(self, mark):
+        targets = dict()
+        while len(self.log) > mark:
+            node, district, serial = self.log.pop()
+            if node is None:
+                self.pending.pop()
+            else:
+                targets[node] = district
+
+        # Every node goes back to the district it had before its first entry
+        # after the marker, unless it is already there
+        self.relocate({node : district for node, district in targets.items()
+            if self.assignment[node] != district})
+
+        while self.materialized and self.materialized[-1][0] >= mark:
+            self.applied = self.materialized.pop()[1]
+        self.applied = min(self.applied, len(self.pending))
+
+    # state_id
+    # Return a number that identifies the current state. Undoing back to a 
+    # state restores its id.
+    def state_id(self, mark = None):
+        if mark is None:
+            mark = len(self.log)
+        if mark == 0:
+            return 0
+        return self.log[mark - 1][2]
+
+    # unallocated_contiguous
+    # Return whether or not the unallocated nodes are contiguous. When the last
+    # flip moved a single node out of unallocated nodes that were contiguous,
+    # the local test around that node is tried first. Otherwise the answer 
+    # comes from the cut nodes of the unallocated nodes before that flip, which
+    # are shared by every candidate tried from the same state.
+    def unallocated_contiguous(self):
+        self.materialize()
+        if 1 not in self.parts:
+            return True
+        if len(self.parts[1]) == 0:
+            return False
+
+        if len(self.log) != 0:
+            node, old_district, serial = self.log[-1]
+            if (node is not None and old_district == 1 and 
+                self.assignment[node] != 1):
+                previous_id = self.state_id(len(self.log) - 1)
+                if self.known_contiguous(previous_id):
+                    contiguous = self.local_contiguous(node)
+                    if contiguous is not None:
+                        return self.remember_contiguous(contiguous)
+
+                connected, cut_nodes = self.get_cut_nodes(previous_id, node)
+                if connected:
+                    return self.remember_contiguous(node not in cut_nodes)
+
+        connected, cut_nodes = self.get_cut_nodes(self.state_id())
+        return self.remember_contiguous(connected)
+
+    # splits_unallocated
+    # Return whether or not moving the given unallocated node to a district 
+    # would leave the unallocated nodes discontiguous
+    def splits_unallocated(self, node):
+        self.materialize()
+        if len(self.parts[1]) == 1:
+            return True
+        if self.known_contiguous(self.state_id()):
+            contiguous = self.local_contiguous(node)
+            if contiguous is not None:
+                return not contiguous
+
+        connected, cut_nodes = self.get_cut_nodes(self.state_id())
+        if connected:
+            return node in cut_nodes
+
+        # If the unallocated nodes are already discontiguous, check the nodes
+        # that would be left directly
+        connected, cut_nodes = find_cut_nodes(self.neighbors, 
+            self.parts[1] - {node})
+        return not connected
+
+    # local_contiguous
+    # Given that the unallocated nodes were contiguous with the given node, 
+    # return whether or not they stay contiguous without it, or None if the
+    # local test cannot tell
+    def local_contiguous(self, node):
+        if self.neighbor_order is None:
+            return None
+        return check_local_contiguous(node, self.neighbor_order[node], 
+            self.neighbors, self.parts[1], LOCAL_SEARCH_SIZE)
+
+    # known_contiguous
+    # Return whether or not the unallocated nodes of the given state are known
+    # to be contiguous
+    def known_contiguous(self, state_id):
+        if state_id in self.contiguous_states:
+            return True
+        return (state_id in self.cut_node_cache and 
+            self.cut_node_cache[state_id][0])
+
+    # remember_contiguous
+    # Record the current state if its unallocated nodes are contiguous and 
+    # return the result of the check
+    def remember_contiguous(self, contiguous):
+        if contiguous:
+            self.contiguous_states[self.state_id()] = True
+            if len(self.contiguous_states) > CUT_NODE_CACHE_SIZE:
+                self.contiguous_states.popitem(last = False)
+        return contiguous
+
+    # known_district_contiguous
+    # Return whether or not the given district of the given state is known to
+    # be contiguous
+    def known_district_contiguous(self, state_id, district):
+        return (state_id, district) in self.contiguous_districts
+
+    # remember_district_contiguous
+    # Record that the given district of the current state is contiguous
+    def remember_district_contiguous(self, district):
+        self.contiguous_districts[(self.state_id(), district)] = True
+        if len(self.contiguous_districts) > CUT_NODE_CACHE_SIZE:
+            self.contiguous_districts.popitem(last = False)
+
+    # get_cut_nodes
+    # Return whether or not the unallocated nodes of the given state are 
+    # connected along with the set of unallocated nodes whose removal would
+    # disconnect them. The state is either the current one or, if a node is 
+    # given, the one before that node was moved out of the unallocated nodes.
+    def get_cut_nodes(self, state_id, node = None):
+        if state_id in self.cut_node_cache:
+            self.cut_node_cache.move_to_end(state_id)
+            return self.cut_node_cache[state_id]
+
+        region = self.parts[1]
+        if node is not None:
+            region = region | {node}
+        result = find_cut_nodes(self.neighbors, region)
+
+        self.cut_node_cache[state_id] = result
+        if len(self.cut_node_cache) > CUT_NODE_CACHE_SIZE:
+            self.cut_node_cache.popitem(last = False)
+        return result
+
+    # move
+    # Move a node to a new district and update the parts, population, Zobrist
+    # hash, cut edges and frontiers accordingly
+    def move(self, node, district):
+        old_district = self.assignment[node]
+        node_population = self.node_population[node]
+
+        self.parts[old_district].remove(node)
+        self.population[old_district] -= node_population
+
+        if district not in self.parts:
+            self.parts[district] = set()
+            self.population[district] = 0
+        self.parts[district].add(node)
+        self.population[district] += node_population
+
+        self.assignment[node] = district
+        self.zobrist ^= hash((node, old_district)) ^ hash((node, district))
+
+        # Only the edges touching the node can change whether they are cut or
+        # which frontiers they add to
+        assignment = self.assignment
+        cut_edges = self.cut_edges
+        frontier = self.frontier
+
+        # A district filled by move_many with no unallocated neighbors may
+        # never have been given a frontier
+        old_frontier = None
+        if old_district != 1:
+            old_frontier = frontier.get(old_district)
+        if district != 1:
+            new_frontier = frontier.get(district)
+            if new_frontier is None:
+                new_frontier = frontier[district] = dict()
+        for neighbor in self.neighbors[node]:
+            neighbor_district = assignment[neighbor]
+            edge = (node, neighbor) if node < neighbor else (neighbor, node)
+            if neighbor_district == district:
+                cut_edges.discard(edge)
+            else:
+                cut_edges.add(edge)
+
+            # An unallocated neighbor moves from the frontier of the old 
+            # district to the frontier of the new one
+            if neighbor_district == 1:
+                if old_frontier is not None:
+                    decrement(old_frontier, neighbor)
+                if district != 1:
+                    new_frontier[neighbor] = new_frontier.get(neighbor, 0) + 1
+
+            # The node itself leaves or joins the frontier of the neighbor's
+            # district
+            elif old_district == 1:
+                decrement(frontier[neighbor_district], node)
+            elif district == 1:
+                increment(frontier, neighbor_district, node)
+
+# find_cut_nodes
+# Return whether or not the given nodes are connected along with the set of 
+# nodes whose removal would disconnect them (the articulation points). This is
+# Tarjan's depth first search, written with an explicit stack.
+def find_cut_nodes(neighbors, region):
+    root = next(iter(region))
+    depth = {root : 0}
+    low = {root : 0}
+    cut_nodes = set()
+    root_children = 0
+
+    stack = [(root, None, iter(neighbors[root]))]
+    while stack:
+        node, parent, children = stack[-1]
+        for child in children:
+            if child == parent or child not in region:
+                continue
+            if child in depth:
+                low[node] = min(low[node], depth[child])
+            else:
+                depth[child] = depth[node] + 1
+                low[child] = depth[child]
+                stack.append((child, node, iter(neighbors[child])))
+                break
+
+        # Once every child has been visited, pass the lowest depth reachable
+        # from the node up to its parent
+        else:
+            stack.pop()
+            if parent is not None:
+                low[parent] = min(low[parent], low[node])
+                if parent == root:
+                    root_children += 1
+                elif low[node] >= depth[parent]:
+                    cut_nodes.add(parent)
+
+    if root_children > 1:
+        cut_nodes.add(root)
+
+    return len(depth) == len(region), cut_nodes
+
+# check_local_contiguous
+# Given that the nodes of region together with the given node are contiguous, 
+# return whether or not region stays contiguous without the node. Neighbors 
+# that follow one another in the cyclic order around the node and share an 
+# edge are already connected, so the region stays contiguous when this leaves
+# a single group. Otherwise a search of at most search_size nodes tries to 
+# connect the groups. None is returned if the search runs out before deciding.
+def check_local_contiguous(node, neighbor_order, neighbors, region, 
+    search_size):
+
+    # Find the neighbors in the region and group consecutive ones that share an
+    # edge
+    ring = [neighbor for neighbor in neighbor_order if neighbor in region]
+    if len(ring) == 0:
+        return None
+    if len(ring) == 1:
+        return True
+
+    groups = {neighbor : neighbor for neighbor in ring}
+    for i in range(len(neighbor_order)):
+        first = neighbor_order[i - 1]
+        second = neighbor_order[i]
+        if (first in groups and second in groups and 
+            second in neighbors[first]):
+            groups[find_group(groups, first)] = find_group(groups, second)
+
+    unreached = {find_group(groups, neighbor) for neighbor in ring}
+    if len(unreached) == 1:
+        return True
+
+    # Search outward from the first group until every group is reached, the 
+    # first group's component is used up or the search gets too large
+    start = ring[0]
+    unreached.discard(find_group(groups, start))
+    visited = {node, start}
+    queue = deque([start])
+    while queue:
+        if len(visited) > search_size:
+            return None
+        current = queue.popleft()
+        for neighbor in neighbors[current]:
+            if neighbor not in visited and neighbor in region:
+                visited.add(neighbor)
+                queue.append(neighbor)
+                if neighbor in groups:
+                    unreached.discard(find_group(groups, neighbor))
+                    if len(unreached) == 0:
+                        return True
+
+    return False
+
+# find_group
+# Return the representative of the group containing the given neighbor
+def find_group(groups, neighbor):
+    while groups[neighbor] != neighbor:
+        groups[neighbor] = groups[groups[neighbor]]
+        neighbor = groups[neighbor]
+    return neighbor
+
+# increment
+# Add one to the count of the node in the frontier of the district
+def increment(frontier, district, node):
+    counts = frontier.get(district)
+    if counts is None:
+        counts = frontier[district] = dict()
+    counts[node] = counts.get(node, 0) + 1
+
+# decrement
+# Subtract one from the count of the node in the frontier of a district, 
+# removing the node once it no longer borders the district
+def decrement(counts, node):
+    count = counts[node]
+    if count == 1:
+        del counts[node]
+    else:
+        counts[node] = count - 1
+
+# order_edge
+# Return the edge between two nodes with the smaller node first so that each
+# edge has a single representation in the set of cut edges
+def order_edge(node1, node2):
+    if node1 < node2:
+        return (node1, node2)
+    return (node2, node1)
+
+# get_search_states
+# Create a search state for each partition in the list
+def get_search_states(partitions, pop_col):
+    return [SearchState(partition.graph, partition.assignment, pop_col)
+        for partition in partitions]
+
+# get_unallocated_states
+# Create a search state for each graph in the list with every node unallocated
+def get_unallocated_states(graph_list, pop_col):
+    return [SearchState(graph, dict.fromkeys(graph.nodes, 1), pop_col)
+        for graph in graph_list]
+
+# get_marks
+# Return a marker for the current point in the log of every search state in
+# the list. Entries that are None are skipped.
+def get_marks(states):
+    return [state.mark() if state is not None else None for state in states]
+
+# undo_marks
+# Undo every flip made since the given markers
+def undo_marks(states, marks):
+    for state, mark in zip(states, marks):
+        if state is not None:
+            state.undo(mark)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+split_templates.py
+
+Created by Charlie Murphy
+18 October 2026
+
+This file builds a library of split templates ahead of time and looks them up
+while maps are created. A template is a way of splitting a county into two
+connected pieces made of whole municipalities, or a large municipality into
+two connected pieces made of whole VTDs. The templates of each county and
+municipality are sampled by growing connected pieces at random and are stored
+sorted by the population of the piece, so the templates that give a district
+the population it needs can be found by a binary search. The templates are 
+stored with the stamp of the graph file they were made from and are only loaded
+for that graph file, since they refer to its nodes and populations. When run
+directly, this file samples the templates for the graphs given in 
+input_template_2.py and writes them to the template file.
+'''
+
+from bisect import bisect_left, bisect_right
+from graph_cache import get_graph_keys, get_graph_paths
+from graph_snapshot import (get_file_stamp, read_snapshot_graphs, 
+    snapshot_matches)
+import os
+import pickle
+import random
+from reusable_data_2 import get_county_subgraphs
+from search_state import find_cut_nodes
+
+# The templates that have been loaded, mapping (level, node) to a pair of lists
+# holding the population of each template and the nodes of the lower level
+# (level) in each template, both sorted by population
+templates = dict()
+
+# make_templates
+# Return the templates of every county at the muni level and of every
+# municipality with at least min_population at the VTD level. samples pieces
+# are grown for each county and municipality.
+def make_templates(graph_list, level_conversions, pop_col, samples,
+    min_population):
+    library = dict()
+
+    # Counties split into municipalities
+    for node, allowed_nodes in level_conversions[0].items():
+        library[(1, node)] = sample_templates(graph_list[1], allowed_nodes,
+            pop_col, samples)
+
+    # Large municipalities split into VTDs
+    for node, allowed_nodes in level_conversions[2].items():
+        if graph_list[1].nodes[node][pop_col] >= min_population:
+            library[(2, node)] = sample_templates(graph_list[2],
+                allowed_nodes, pop_col, samples)
+
+    return library
+
+# sample_templates
+# Grow the given number of pieces of allowed_nodes, each from a random node,
+# one random bordering node at a time. A node is only added if the nodes left
+# over stay connected, so every piece along the way splits allowed_nodes in
+# two connected parts. Return the distinct pieces sorted by their population.
+def sample_templates(graph, allowed_nodes, pop_col, samples):
+    neighbors = {node : [neighbor for neighbor in graph.neighbors(node)
+        if neighbor in allowed_nodes] for node in allowed_nodes}
+    pieces = dict()
+
+    if len(allowed_nodes) < 2:
+        return [], []
+    if not find_cut_nodes(neighbors, allowed_nodes)[0]:
+        return [], []
+
+    for i in range(samples):
+        piece = set()
+        population = 0
+        rest = set(allowed_nodes)
+        _, cut_nodes = find_cut_nodes(neighbors, rest)
+        candidates = [node for node in rest if node not in cut_nodes]
+
+        while len(rest) > 1:
+            if candidates == []:
+                break
+
+            # Add a random candidate to the piece
+            node = random.choice(candidates)
+            piece.add(node)
+            rest.remove(node)
+            population += graph.nodes[node][pop_col]
+            pieces[frozenset(piece)] = population
+
+            # Find the nodes bordering the piece that can be added without
+            # disconnecting the rest
+            _, cut_nodes = find_cut_nodes(neighbors, rest)
+            candidates = list(set(neighbor for node in piece
+                for neighbor in neighbors[node]
+                if neighbor in rest and neighbor not in cut_nodes))
+
+    ordered = sorted(pieces.items(), key = lambda item: item[1])
+    return ([population for piece, population in ordered],
+        [tuple(sorted(piece)) for piece, population in ordered])
+
+# get_graph_stamp
+# Return the stamp of the graph file the templates are made from, or None if
+# there is no graph file
+def get_graph_stamp(graph_dump):
+    if graph_dump is None or not os.path.isfile(graph_dump):
+        return None
+    return tuple(get_file_stamp(graph_dump).tolist())
+
+# write_templates
+# Write the templates to the template file along with the stamp of the graph
+# file they were made from
+def write_templates(library, template_file, graph_dump):
+    with open(template_file, "wb") as file:
+        pickle.dump({"graphs" : get_graph_stamp(graph_dump), 
+            "templates" : library}, file)
+
+# load_templates
+# Load the templates in the template file, if there is one, so that they are
+# used by step_down. Templates made from a different graph file are not loaded.
+def load_templates(template_file, graph_dump):
+    templates.clear()
+    if template_file is None or not os.path.isfile(template_file):
+        return
+
+    stored = pickle.load(open(template_file, "rb"))
+    if (not isinstance(stored, dict) or "graphs" not in stored or
+        stored["graphs"] != get_graph_stamp(graph_dump)):
+        print("Templates", template_file, "were not made from", graph_dump, 
+            "and are not used")
+        return
+    templates.update(stored["templates"])
+
+# get_templates
+# Return the population and nodes of each template of the node at the given 
+# level whose piece has a population within population_deviation of the given
+# population and whose rest has less than max_rest_population
+def get_templates(level, node, population, population_deviation,
+    node_population, max_rest_population):
+    if (level, node) not in templates:
+        return []
+    populations, pieces = templates[(level, node)]
+
+    start = bisect_left(populations, population - population_deviation)
+    end = bisect_right(populations, population + population_deviation)
+    return [(populations[i], pieces[i]) for i in range(start, end)
+        if node_population - populations[i] < max_rest_population]
+
+# The templates are only made when this file is run directly
+if __name__ == "__main__":
+
+    # Input Values
+    exec(open("input_template_2.py").read())
+
+    # Take the graphs from the graph cache if there is one, generating them if
+    # they are not there yet
+    if graph_cache is not None:
+        graph_dump, graph_snapshot = get_graph_paths(graph_cache, 
+            get_graph_keys(graph_cache, county_file, muni_file, vtd_file, 
+            assignment_col, county_col, geoid_col, muni_col, name_col, 
+            pop_col, geom_col))
+        if not os.path.isdir(graph_snapshot):
+            exec(open("pickle_graph_2.py").read())
+
+    # Load the graphs from the snapshot if it was written for the current 
+    # graph file, or else from the graph file
+    if snapshot_matches(graph_snapshot, graph_dump):
+        graph_list, level_conversions = read_snapshot_graphs(graph_snapshot,
+            muni_col)
+    else:
+        graph_list = pickle.load(open(graph_dump, "rb"))
+        level_conversions = [
+            get_county_subgraphs(graph_list[0], graph_list[1], county_col),
+            get_county_subgraphs(graph_list[0], graph_list[2], county_col),
+            get_county_subgraphs(graph_list[1], graph_list[2], muni_col),
+            muni_col]
+
+    # Municipalities with less population than the population deviation are
+    # rarely split and are not given templates
+    total_population = sum(graph_list[0].nodes[node][pop_col]
+        for node in graph_list[0].nodes)
+    min_population = (total_population / district_num) * epsilon
+
+    random.seed(seed)
+    write_templates(make_templates(graph_list, level_conversions, pop_col,
+        template_samples, min_population), template_file, graph_dump)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+test_partition_functions_2.py
+
+Created by Charlie Murphy
+18 October 2026
+
+This file checks that the local contiguity check made by check_split_nodes for
+search states gives the same answer as checking the whole district, on a grid
+of VTDs grouped into square municipalities. Districts are grown from whole
+municipalities, and some are left discontiguous before the next municipality
+is added, as a split at a lower level may leave them.
+'''
+
+import networkx
+from partition_functions_2 import check_split_nodes
+import random
+from search_state import SearchState, find_cut_nodes, get_marks
+
+# Size of the grid of VTDs and of the side of each municipality
+GRID_SIZE = 12
+MUNI_SIZE = 2
+
+# make_grid
+# Return the VTD graph of the grid along with the VTDs of every municipality
+def make_grid():
+    graph = networkx.convert_node_labels_to_integers(
+        networkx.grid_2d_graph(GRID_SIZE, GRID_SIZE), label_attribute = "xy")
+    munis = dict()
+    for node in graph.nodes:
+        x, y = graph.nodes[node]["xy"]
+        graph.nodes[node]["pop"] = 1
+        muni = (x // MUNI_SIZE) * (GRID_SIZE // MUNI_SIZE) + y // MUNI_SIZE
+        munis.setdefault(muni, set()).add(node)
+    return graph, munis
+
+# get_muni_neighbors
+# Return the municipalities that border the VTDs of the district and are not in
+# it
+def get_muni_neighbors(state, munis, district):
+    found = set()
+    for muni, vtds in munis.items():
+        if any(state.assignment[node] == 1 and any(
+            state.assignment[neighbor] == district
+            for neighbor in state.neighbors[node]) for node in vtds):
+            found.add(muni)
+    return found
+
+# test_local_check_matches_full_check
+# Grow districts one municipality at a time and compare the local check with
+# the whole district after every municipality is added
+def test_local_check_matches_full_check():
+    random.seed(0)
+    graph, munis = make_grid()
+    level_conversions = [dict(), dict(), munis]
+    rejected_after_break = 0
+
+    for trial in range(200):
+        state = SearchState(graph, dict.fromkeys(graph.nodes, 1), "pop")
+        partitions = [None, None, state]
+        district = 2
+        state.flip(dict.fromkeys(munis[random.choice(list(munis))], district))
+        state.remember_district_contiguous(district)
+
+        for step in range(8):
+
+            # Sometimes leave the district discontiguous before the next
+            # municipality, without recording anything about it
+            broken = False
+            if random.random() < 0.2:
+                unallocated = [node for node in graph.nodes
+                    if state.assignment[node] == 1]
+                state.flip({random.choice(unallocated) : district})
+                broken = not find_cut_nodes(state.neighbors,
+                    state.parts[district])[0]
+
+            candidates = get_muni_neighbors(state, munis, district)
+            if len(candidates) == 0:
+                break
+            muni = random.choice(sorted(candidates))
+            marks = get_marks(partitions)
+            state.flip(dict.fromkeys(munis[muni], district))
+
+            local = check_split_nodes(partitions, 1, [set(), {muni}], muni,
+                district, level_conversions, marks)
+            full = find_cut_nodes(state.neighbors, state.parts[district])[0]
+            assert local == full
+            if broken and not full:
+                rejected_after_break += 1
+
+    # The districts left discontiguous must have been caught
+    assert rejected_after_break > 0
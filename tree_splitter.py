@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+tree_splitter.py
+
+Created by Charlie Murphy
+18 October 2026
+
+This file splits a county or municipality in two by drawing a random spanning
+tree of the nodes within it at the level below and cutting one of its edges,
+as ReCom does. The nodes of each county and municipality are compiled into
+numpy arrays the first time it is split. The population and number of nodes
+bordering the district below every edge of a tree are then found in a single
+pass, so every edge that gives a valid split is found from one draw.
+'''
+
+import numpy
+import random
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import breadth_first_order, minimum_spanning_tree
+
+# The compiled nodes of the counties and municipalities that have been split,
+# mapping (level, node) to the nodes, the edges between them and their
+# populations
+tree_graphs = dict()
+
+# compile_subgraph
+# Return the nodes in allowed_nodes as a sorted array, the edges between them
+# as pairs of indices into that array, and their populations
+def compile_subgraph(partition, allowed_nodes):
+    nodes = sorted(allowed_nodes)
+    index = {node : i for i, node in enumerate(nodes)}
+
+    edges = [(index[node], index[neighbor]) for node in nodes
+        for neighbor in partition.neighbors[node]
+        if neighbor in index and index[neighbor] > index[node]]
+    edges = numpy.array(edges, dtype = numpy.int32).reshape(-1, 2)
+
+    populations = numpy.array([partition.node_population[node]
+        for node in nodes], dtype = numpy.int64)
+
+    return numpy.array(nodes), edges, populations
+
+# get_subgraph
+# Return the compiled nodes of the given county or municipality
+def get_subgraph(partition, level, node, allowed_nodes):
+    if (level, node) not in tree_graphs:
+        tree_graphs[(level, node)] = compile_subgraph(partition, allowed_nodes)
+    return tree_graphs[(level, node)]
+
+# draw_tree
+# Return the order in which a breadth first search from the first node visits
+# a random spanning tree of the subgraph, along with the parent of each node in
+# that tree, or None if the subgraph is not connected. The tree is the minimum
+# spanning tree for random edge weights.
+def draw_tree(node_num, edges):
+    generator = numpy.random.default_rng(random.getrandbits(32))
+    weights = generator.random(len(edges)) + 1
+    graph = csr_matrix((weights, (edges[:, 0], edges[:, 1])),
+        shape = (node_num, node_num))
+
+    tree = minimum_spanning_tree(graph)
+    if tree.nnz != node_num - 1:
+        return None
+    return breadth_first_order(tree, 0, directed = False)
+
+# draw_split
+# Draw a random spanning tree of the nodes within the given county or
+# municipality and return the population and nodes of a random piece that can
+# be cut from it along one edge, or None if no edge gives a valid piece. A
+# piece is valid if its population is within population_deviation of the given
+# population, the rest of the nodes have less than max_rest_population, and it
+# holds at least one of bordering_nodes.
+def draw_split(partition, level, node, allowed_nodes, population,
+    population_deviation, max_rest_population, bordering_nodes):
+    nodes, edges, populations = get_subgraph(partition, level, node,
+        allowed_nodes)
+    if len(nodes) < 2:
+        return None
+
+    tree = draw_tree(len(nodes), edges)
+    if tree is None:
+        return None
+    order, parents = tree
+
+    # Add up the population and bordering nodes below every node of the tree
+    # in a single pass from the leaves up
+    below_population = populations.copy()
+    below_bordering = numpy.array([node in bordering_nodes
+        for node in nodes.tolist()], dtype = numpy.int64)
+    for i in order[:0:-1].tolist():
+        below_population[parents[i]] += below_population[i]
+        below_bordering[parents[i]] += below_bordering[i]
+
+    # Every edge of the tree joins a node other than the first to its parent.
+    # The piece is either the nodes below the edge or the rest of the nodes.
+    children = order[1:]
+    total_population = below_population[order[0]]
+    total_bordering = below_bordering[order[0]]
+    pieces = []
+    for below, piece_population, piece_bordering in [
+        (True, below_population[children], below_bordering[children]),
+        (False, total_population - below_population[children],
+            total_bordering - below_bordering[children])]:
+        valid = ((numpy.abs(piece_population - population) <=
+            population_deviation) & (total_population - piece_population <
+            max_rest_population) & (piece_bordering > 0))
+        pieces.extend((below, child) for child in children[valid].tolist())
+
+    if pieces == []:
+        return None
+    below, child = random.choice(pieces)
+
+    # Find the nodes below the chosen edge. The breadth first order visits
+    # every parent before its children.
+    in_piece = numpy.zeros(len(nodes), dtype = bool)
+    in_piece[child] = True
+    for i in order.tolist():
+        if i != child and i != order[0] and in_piece[parents[i]]:
+            in_piece[i] = True
+    if not below:
+        in_piece = ~in_piece
+
+    return (int(populations[in_piece].sum()),
+        tuple(nodes[in_piece].tolist()))
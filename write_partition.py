@@ -11,8 +11,8 @@ This file contains functions that can write a partition either to a shapefile
 or to a CSV that can be opened by DRA.
 '''
 
-import geopandas
 import pandas
+from read_layers import read_layer
 from reusable_data_2 import get_county_subgraphs
 
 # write_to_csv
@@ -21,17 +21,20 @@ from reusable_data_2 import get_county_subgraphs
 # used in DRA.
 def write_to_csv(partition, geoid_col, assignment_col, folder, name):
     plan = pandas.DataFrame(partition.graph.data[geoid_col])
-    plan[assignment_col] = partition.assignment.to_series()
+    plan[assignment_col] = pandas.Series(partition.assignment)
     filename = './Ensembles/' + folder + '/' + name + '.csv'
     plan.to_csv(filename, index = False)
 
 # write_to_shapefile
 # Creates a Shapefile in the specified subfolder of the Ensembles folder that
 # includes a field with the district assignment. Note that this method is both
-# slower and creates more file clutter than the CSV version.
-def write_to_shapefile(partition, assignment_col, vtds_file, folder, name):
-    vtds = geopandas.read_file(vtds_file)
-    vtds[assignment_col] = partition.assignment.to_series()
+# slower and creates more file clutter than the CSV version. If a cache folder
+# is given, the VTDs are taken from the layer cache there rather than read from
+# the shapefile for every plan.
+def write_to_shapefile(partition, assignment_col, vtds_file, folder, name,
+    cache_folder = None):
+    vtds = read_layer(vtds_file, cache_folder = cache_folder)
+    vtds[assignment_col] = pandas.Series(partition.assignment)
     filename = './Ensembles/' + folder + '/' + name + '.shp'
     vtds.to_file(filename, index = False)
 
@@ -44,10 +47,12 @@ def write_counties_to_csv(county_partition, vtd_partition, geoid_col, county_col
     subgraphs = get_county_subgraphs(county_partition.graph, 
         vtd_partition.graph, county_col)
 
+    # Flip the VTDs of every allocated county at once
+    flips = dict()
     for node in county_partition.graph.nodes():
         district = county_partition.assignment[node]
         if district != 1:
-            for vtd_node in subgraphs[node]:
-                vtd_partition = vtd_partition.flip({vtd_node: district})
+            flips.update(dict.fromkeys(subgraphs[node], district))
+    vtd_partition = vtd_partition.flip(flips)
 
     write_to_csv(vtd_partition, geoid_col, assignment_col, folder, name)